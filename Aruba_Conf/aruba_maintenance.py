@@ -0,0 +1,41 @@
+import csv
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from aruba_common.jobs import Command, ConfigSet, Reload, WriteMem, compose
+from aruba_common.script import credentials, run_script
+
+# Most controllers in flight, and so reloading, at once; the limiter never goes above it
+max_threads = 100
+device_timeout = 600
+
+# hostname,conf csv file (more than one command separated by '='), conf may be empty
+conffile_csv = '/Users/maintenance.csv'
+
+# Everything for the maintenance window, run in order over one login per controller.
+# Remove what isn't needed; Reload has to stay last.
+operations = [ConfigSet(),
+              Command('stm purge-blacklist-clients'),
+              WriteMem(),
+              Reload()]
+
+
+def read_devices():
+    with open(conffile_csv) as devices:
+        for row in csv.DictReader(devices):
+            yield [row['hostname'], row['conf']]
+
+
+username, password = credentials()
+
+report = run_script(__file__, read_devices(), compose(*operations), username, password,
+                    max_threads=max_threads, headroom=1, timeout=device_timeout)
+print('*** Finished SSH Sessions ***')
+
+if report.failed:
+    print('*** Errors Encountered ***')
+    for result in report.failed:
+        print('{}, {}'.format(result.host, result.error))
+
+print('*** Finished Script - {} seconds ***'.format(str(round(report.elapsed, 2))))
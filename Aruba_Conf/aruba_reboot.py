@@ -1,86 +1,45 @@
 import csv
-import netmiko
-from Queue import Queue
-from threading import Thread, RLock
-from getpass import getpass
-from netmiko.ssh_exception import NetMikoTimeoutException
-from netmiko.ssh_exception import NetMikoAuthenticationException
+import os
+import sys
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from aruba_common.jobs import Reload, WriteMem, compose
+from aruba_common.rolling import RollingReboot
+from aruba_common.script import credentials, run_script
+
+# Most controllers in flight, and so reloading, at once; the limiter never goes above it
 max_threads = 100
-working_queue = Queue()
-print_lock = RLock()
-username = raw_input('Username:')
-password = getpass()
+device_timeout = 300
+# Run with --rolling to reboot a few controllers per site at a time and wait for each to come back.
+# Rolling reboots run from one host only, not with --coordinator/--worker.
+rolling = '--rolling' in sys.argv
+wave_size = 20
+site_cap = 2
+# Stop rebooting once this many controllers fail to come back
+max_failures = 3
 hosts_csv = '/Users'
-error_list = []
-
-
-def ssh_session(thread_num, work_queue):
-    while True:
-        queued_host = work_queue.get()
-        with print_lock:
-            print '{}: Working on "{}"'.format(thread_num, queued_host)
-        try:
-            router = {'device_type': 'aruba_os',
-                      'ip': queued_host,
-                      'username': username,
-                      'password': password,
-                      'verbose': False}
-            ssh_session = netmiko.ConnectHandler(**router)
-
-            ssh_session.send_command('write mem')
-
-            output = ssh_session.send_command_timing('reload')
-            if 'Do you really want to restart the system(y/n):' in output:
-                ssh_session.send_command_timing('y', max_loops=20)
-
-            ssh_session.disconnect()
-        except Exception, e:
-            error_list.append([queued_host, e])
-
-        work_queue.task_done()
 
 
-def ssh_test():
-    while True:
-        try:
-            test_device = {'device_type': 'linux', 'ip': 'localhost',
-                           'username': username, 'password': password}
-            ssh_session = netmiko.ConnectHandler(**test_device)
-            ssh_session.disconnect()
-            return True
-        except (NetMikoAuthenticationException):
-            print('Username or Password Error')
-            return False
-        except (NetMikoTimeoutException):
-            print('Localhost timeout')
-            return False
+reboot = compose(WriteMem(), Reload())
 
-print '*** Testing SSH Creds ***'
-if ssh_test() != True:
-    exit()
-print '*** SSH Creds Success! ***'
 
-for thread_num in range(max_threads):
-    worker = Thread(target=ssh_session, args=(
-        thread_num, working_queue))
-    worker.setDaemon(True)
-    worker.start()
+def read_hosts():
+    with open(hosts_csv) as devices:
+        for row in csv.DictReader(devices):
+            yield row['hostname']
 
-with open(hosts_csv) as devices:
-    deviceDict = csv.DictReader(devices)
-    for row in deviceDict:
-        with print_lock:
-            print 'Putting {} in queue'.format(row['hostname'])
-        working_queue.put(row['hostname'])
 
+username, password = credentials()
 
-with print_lock:
-    print '*** Waiting for all threads to complete ***'
-working_queue.join()
-print '*** Finished SSH Sessions ***'
+rollout = None
+if rolling:
+    rollout = RollingReboot(username, password, wave_size=wave_size, site_cap=site_cap,
+                            max_failures=max_failures).run
+report = run_script(__file__, read_hosts(), reboot, username, password,
+                    max_threads=max_threads, headroom=1, timeout=device_timeout, run=rollout)
+print('*** Finished SSH Sessions ***')
 
-if len(error_list) > 0:
-    print '*** Errors Encountered ***'
-    for i in error_list:
-        print '{}, {}'.format(i[0], i[1])
+if report.failed:
+    print('*** Errors Encountered ***')
+    for result in report.failed:
+        print('{}, {}'.format(result.host, result.error))
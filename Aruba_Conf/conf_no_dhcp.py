@@ -1,106 +1,45 @@
 import csv
-import time
 import os
-import netmiko
-from Queue import Queue
-from threading import Thread, RLock
-from getpass import getpass
-from netmiko.ssh_exception import NetMikoTimeoutException
-from netmiko.ssh_exception import NetMikoAuthenticationException
+import sys
 
-# Set max threads
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from aruba_common.metrics import stage
+from aruba_common.script import credentials, run_script
+
+# Sessions the old fixed thread pool ran, the limiter may go up to 4x this while logins stay fast
 max_threads = 100
-working_queue = Queue()
-print_lock = RLock()
-output_dict = {}
-# NOTE: raw input and getpass don't work in IDE
-username = raw_input('Username:')
-password = getpass()
+device_timeout = 300
 write_mem = True
 conffile_csv = '/Users/PythonCode/Output/test.csv'
-output_list = []
-
-# SSH Function called by threads, pulls host from Queue
-
-
-def ssh_session(thread_num, work_queue):
-    while True:
-        queued_device = work_queue.get()
-        queued_host = queued_device[0]
-        print queued_host
-        queued_conf_list = queued_device[1].split('=')
-
-        print queued_conf_list
-        with print_lock:
-            print '{}: Working on "{}"'.format(thread_num, queued_host)
-        try:
-            router = {'device_type': 'aruba_os',
-                      'ip': queued_host,
-                      'username': username,
-                      'password': password,
-                      'verbose': False}
-            ssh_session = netmiko.ConnectHandler(**router)
-            ssh_session.send_config_set(queued_conf_list)
-
-            if write_mem:
-                ssh_session.send_command('write mem')
-
-            ssh_session.disconnect()
-        except Exception, e:
-            with print_lock:
-                print '{} - Failed to create SSH session\n Due to {}'.format(queued_host, e)
-
-        work_queue.task_done()
-
-# Used to test credentials against localhost
 
 
-def ssh_test():
-    while True:
-        try:
-            test_device = {'device_type': 'linux', 'ip': 'localhost',
-                           'username': username, 'password': password}
-            ssh_session = netmiko.ConnectHandler(**test_device)
-            ssh_session.disconnect()
-            return True
-        except (NetMikoAuthenticationException):
-            print('Username or Password Error')
-            return False
-        except (NetMikoTimeoutException):
-            print('Localhost timeout')
-            return False
+# Called by the engine with an open session for each queued device
+def push_config(ssh_session, queued_device):
+    queued_conf_list = queued_device[1].split('=')
+    print(queued_conf_list)
+    with stage('config'):
+        ssh_session.send_config_set(queued_conf_list)
 
+    if write_mem:
+        with stage('write_mem'):
+            ssh_session.send_command('write mem')
 
-startTime = time.time()
 
-print '*** Testing SSH Creds ***'
-# Test User Creds
-if ssh_test() != True:
-    exit()
-print '*** SSH Creds Success! ***'
+def read_devices():
+    with open(conffile_csv) as devices:
+        for row in csv.DictReader(devices):
+            yield [row['hostname'], row['conf']]
 
-# Build Threads
-for thread_num in range(max_threads):
-    worker = Thread(target=ssh_session, args=(
-        thread_num, working_queue))
-    worker.setDaemon(True)
-    worker.start()
 
-# Build Queue from hostfile
-with open(conffile_csv) as devices:
-    deviceDict = csv.DictReader(devices)
-    for row in deviceDict:
-        with print_lock:
-            print 'Putting {} in queue'.format(row['hostname'])
-        # Put device hostname in queue
-        working_queue.put([row['hostname'], row['conf']])
+# Prompt for and test user creds
+username, password = credentials()
 
+report = run_script(__file__, read_devices(), push_config, username, password,
+                    max_threads=max_threads, timeout=device_timeout)
+print('*** Finished SSH Sessions ***')
 
-# Waiting for the Queue to empty
-with print_lock:
-    print '*** Waiting for all threads to complete ***'
-working_queue.join()
-print '*** Finished SSH Sessions ***'
+for result in report.failed:
+    print('{} - Failed to create SSH session\n Due to {}'.format(result.host, result.error))
 
 # Printing time in seconds, rounding to 2 decimals
-print '*** Finished Script - {} seconds ***'.format(str(round((time.time() - startTime), 2)))
+print('*** Finished Script - {} seconds ***'.format(str(round(report.elapsed, 2))))
@@ -1,93 +1,63 @@
-import csv
-from netmiko import ConnectHandler
-from Queue import Queue
-from threading import Thread, RLock
-from getpass import getpass
+import os
+import sys
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from aruba_common.csv_groups import grouped_rows
+from aruba_common.config_diff import push_missing
+from aruba_common.metrics import stage
+from aruba_common.script import credentials, run_script
 
+
+# Sessions the old fixed thread pool ran, the limiter may go up to 4x this while logins stay fast
 max_threads = 100
-working_queue = Queue()
-print_lock = RLock()
-error_list = []
-deviceList = []
-output_dict = {}
+device_timeout = 300
+# Only send lines missing from the running-config, no write mem when nothing changed.
+# whitelist-db entries are not in show running-config, so this only adds a config download here
+incremental = False
+# Directory to cache running-configs in between runs, None to always fetch
+running_config_cache = None
 # Datafile setup as hostname,conf lines with each cpsec entry per line (with host specified)
 data_file = '/Users/PythonCode/Input/corp_cpsec_database.csv'
+# False spills to disk to group each host's rows. True streams data_file in one pass,
+# only when each host's rows are together: a host seen again gets a second session
+sorted_input = False
 
 
 def menu(title):
     title = ' ' + title + ' '
-    print '{s:{c}^{n}}'.format(s='', n=30, c='#')
-    print '{s:{c}^{n}}'.format(s=title, n=30, c='#')
-    print '{s:{c}^{n}}'.format(s='', n=30, c='#')
-
-
-def ssh_session(thread_num, work_queue):
-    while True:
-        queued_device = work_queue.get()
-        with print_lock:
-            print '{}: Working on "{}"'.format(thread_num, queued_device[0])
+    print('{s:{c}^{n}}'.format(s='', n=30, c='#'))
+    print('{s:{c}^{n}}'.format(s=title, n=30, c='#'))
+    print('{s:{c}^{n}}'.format(s='', n=30, c='#'))
 
-        try:
-            router = {'device_type': 'aruba_os',
-                      'ip': queued_device[0],
-                      'username': username,
-                      'password': password,
-                      'verbose': False}
-            ssh = ConnectHandler(**router)
-            # Comment out to turn off database purging
-            # output = ssh.send_command_timing('whitelist-db cpsec purge')
-            # if '[y/n]' in output:
-            #     output += ssh.send_command_timing('y')
 
-            ssh.send_config_set(queued_device[1])
+def push_config(ssh, queued_device):
+    # Comment out to turn off database purging
+    # output = ssh.send_command_timing('whitelist-db cpsec purge')
+    # if '[y/n]' in output:
+    #     output += ssh.send_command_timing('y')
 
-            ssh.disconnect()
-        except Exception, e:
-            error_list.append([queued_device, e])
-
-        work_queue.task_done()
+    if incremental:
+        return push_missing(ssh, queued_device[0], queued_device[1],
+                            write_mem=False, cache_dir=running_config_cache)
+    with stage('config'):
+        ssh.send_config_set(queued_device[1])
 
 
 menu('Rebuild CPSEC Database')
 
-username = raw_input('Username: ')
-password = getpass()
-
+username, password = credentials(check=False)
 
-for thread_num in range(max_threads):
-    worker = Thread(target=ssh_session, args=(
-        thread_num, working_queue))
-    worker.setDaemon(True)
-    worker.start()
-
-menu('Building Queue')
-current_key = ''
-new_output = []
-conf_dict = {}
-
-with open(data_file) as file:
-    deviceDict = csv.DictReader(file)
-    for row in deviceDict:
-        if row['hostname'] in conf_dict:
-            conf_dict[row['hostname']].append(row['conf'])
-        else:
-            conf_dict[row['hostname']] = [row['conf']]
-
-for key in conf_dict:
-    with print_lock:
-        print 'Putting {} in queue'.format(key)
-    working_queue.put([key, conf_dict[key]])
-
-with print_lock:
-    menu('Queue loaded')
-working_queue.join()
+menu('Streaming Queue')
+report = run_script(__file__, grouped_rows(data_file, sorted_input=sorted_input), push_config,
+                    username, password, max_threads=max_threads, timeout=device_timeout)
 
 menu('Task Complete')
+if incremental:
+    compliant = [result for result in report.succeeded if not result.output]
+    print('{} devices already compliant, nothing sent'.format(len(compliant)))
 
 
-if error_list:
+if report.failed:
     menu('Errors')
-    for i in error_list:
-        print '{}, {}'.format(i[0], i[1])
-
+    for result in report.failed:
+        print('{}, {}'.format(result.item, result.error))
@@ -1,96 +1,54 @@
 import csv
-import time
-import netmiko
-from Queue import Queue
-from threading import Thread, RLock
-from getpass import getpass
-from netmiko.ssh_exception import NetMikoTimeoutException
-from netmiko.ssh_exception import NetMikoAuthenticationException
+import os
+import sys
 
-# Set max threads
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from aruba_common.config_diff import push_missing
+from aruba_common.metrics import stage
+from aruba_common.script import credentials, run_script
+
+# Sessions the old fixed thread pool ran, the limiter may go up to 4x this while logins stay fast
 max_threads = 100
-working_queue = Queue()
-print_lock = RLock()
-output_dict = {}
-username = raw_input('Username:')
-password = getpass()
+device_timeout = 300
 write_mem = True
+# True to only send lines missing from the running-config, no write mem when nothing changed
+incremental = False
+# Directory to cache running-configs in between runs, None to always fetch
+running_config_cache = None
 
 # holds config in hostname,conf csv file (can add more than one command separated by '=')
 conffile_csv = '/Users/conf.csv'
-output_list = []
-error_list = []
-
-
-def ssh_session(thread_num, work_queue):
-    while True:
-        queued_device = work_queue.get()
-        queued_host = queued_device[0]
-        queued_conf_list = queued_device[1].split('=')
-
-        with print_lock:
-            print '{}: Working on "{}"'.format(thread_num, queued_host)
-        try:
-            router = {'device_type': 'aruba_os',
-                      'ip': queued_host,
-                      'username': username,
-                      'password': password,
-                      'verbose': False}
-            ssh_session = netmiko.ConnectHandler(**router)
-            ssh_session.send_config_set(queued_conf_list)
-
-            if write_mem:
-                ssh_session.send_command('write mem')
-
-            ssh_session.disconnect()
-        except Exception, e:
-            error_list.append([queued_device, e])
-
-        work_queue.task_done()
 
 
-def ssh_test():
-    while True:
-        try:
-            test_device = {'device_type': 'linux', 'ip': 'localhost',
-                           'username': username, 'password': password}
-            ssh_session = netmiko.ConnectHandler(**test_device)
-            ssh_session.disconnect()
-            return True
-        except (NetMikoAuthenticationException):
-            print('Username or Password Error')
-            return False
-        except (NetMikoTimeoutException):
-            print('Localhost timeout')
-            return False
+def push_config(ssh_session, queued_device):
+    queued_conf_list = queued_device[1].split('=')
+    if incremental:
+        return push_missing(ssh_session, queued_device[0], queued_conf_list,
+                            write_mem=write_mem, cache_dir=running_config_cache)
+    with stage('config'):
+        ssh_session.send_config_set(queued_conf_list)
 
-print '*** Testing SSH Creds ***'
-if ssh_test() != True:
-    exit()
-print '*** SSH Creds Success! ***'
+    if write_mem:
+        with stage('write_mem'):
+            ssh_session.send_command('write mem')
 
-# Build Threads
-for thread_num in range(max_threads):
-    worker = Thread(target=ssh_session, args=(
-        thread_num, working_queue))
-    worker.setDaemon(True)
-    worker.start()
 
-with open(conffile_csv) as devices:
-    deviceDict = csv.DictReader(devices)
-    for row in deviceDict:
-        with print_lock:
-            print 'Putting {} in queue'.format(row['hostname'])
-        working_queue.put([row['hostname'], row['conf']])
+def read_devices():
+    with open(conffile_csv) as devices:
+        for row in csv.DictReader(devices):
+            yield [row['hostname'], row['conf']]
 
 
-with print_lock:
-    print '*** Waiting for all threads to complete ***'
-working_queue.join()
-print '*** Finished SSH Sessions ***'
+username, password = credentials()
 
+report = run_script(__file__, read_devices(), push_config, username, password,
+                    max_threads=max_threads, timeout=device_timeout)
+print('*** Finished SSH Sessions ***')
+if incremental:
+    compliant = [result for result in report.succeeded if not result.output]
+    print('*** {} devices already compliant, nothing sent ***'.format(len(compliant)))
 
-print '*** Errors Encountered ***'
-for i in error_list:
-    print '{}, {}'.format(i[0], i[1])
 
+print('*** Errors Encountered ***')
+for result in report.failed:
+    print('{}, {}'.format(result.item, result.error))
@@ -2,11 +2,22 @@ import requests
 import json
 import pprint
 import csv
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 cppm_base = "https://clearpasspm.jsd.ad:443/api"
+# Bulk mode reuses pooled keep-alive connections and only prints a summary at the end
+bulk_import = True
+max_workers = 20
+# Max requests per second sent to ClearPass, 0 for no limit
+rate_limit = 50
+retry_statuses = [429, 500, 502, 503, 504]
 
 
-def gen_cp_token():
+def gen_cp_token(session=requests):
 
     # GENERATE TOKEN
     authURL = cppm_base + "/oauth"
@@ -19,7 +30,7 @@ def gen_cp_token():
                 "client_secret": clientSecret,
                 "username": user,
                 "password": pwd}
-    rAuth = requests.post(authURL, data=authBody, verify=False)
+    rAuth = session.post(authURL, data=authBody, verify=False)
     rAuthJson = rAuth.json()
     token = rAuthJson[u'access_token']
     tokenType = rAuthJson[u'token_type']
@@ -28,7 +39,37 @@ def gen_cp_token():
     # END GENERATE TOKEN
 
 
-def add_cp_device(mac_addr, site, token):
+def cp_session(pool_size=max_workers):
+    """Session with a keep-alive pool sized for the workers and retry on 429/5xx."""
+    retry = Retry(total=5, backoff_factor=0.5, status_forcelist=retry_statuses,
+                  allowed_methods=frozenset(['POST']), raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.verify = False
+    return session
+
+
+class RateLimiter:
+    """Spaces calls to acquire() evenly so no more than rate happen per second."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0
+        self.next_time = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            wait = self.next_time - now
+            self.next_time = max(now, self.next_time) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+
+def add_cp_device(mac_addr, site, token, session=requests, verbose=True):
 
     url = cppm_base + "/device?change_of_authorization=true"
     headers = {'Authorization': token, 'Content-Type': 'application/json'}
@@ -42,17 +83,52 @@ def add_cp_device(mac_addr, site, token):
               "airgroup_shared": "1",
               "airgroup_shared_location": "AP-Group=" + site}
     devicejson = json.dumps(device)
-    pprint.pprint(devicejson)
-    makedevice = requests.post(url, headers=headers, data=devicejson, verify=False)
-    pprint.pprint(makedevice.json())
+    if verbose:
+        pprint.pprint(devicejson)
+    makedevice = session.post(url, headers=headers, data=devicejson, verify=False)
+    if verbose:
+        pprint.pprint(makedevice.json())
+    return makedevice
 
-# "Login" to clearpass
-key = gen_cp_token()
 
-with open('apgroup_device.csv', 'rb') as csvfile:
-    csv_reader = csv.reader(csvfile)
-    for row in csv_reader:
-        # Where the first entry in the row is MAC and second entry is site number
-        add_cp_device(row[0], row[1], key)
+def bulk_add_cp_devices(rows, token, session, workers=max_workers, rate=rate_limit):
+    """Add every (mac, site) row concurrently over one pooled session.
+
+    Returns:
+        list: [mac, site, status code or None, error text or None] per row.
+    """
+    limiter = RateLimiter(rate)
+
+    def add_row(row):
+        limiter.acquire()
+        try:
+            response = add_cp_device(row[0], row[1], token, session=session, verbose=False)
+        except requests.RequestException as e:
+            return [row[0], row[1], None, str(e)]
+        error = None if response.ok else response.text
+        return [row[0], row[1], response.status_code, error]
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(add_row, rows))
 
 
+# "Login" to clearpass
+session = cp_session() if bulk_import else requests
+key = gen_cp_token(session)
+
+with open('apgroup_device.csv', newline='') as csvfile:
+    csv_reader = csv.reader(csvfile)
+    if bulk_import:
+        startTime = time.time()
+        results = bulk_add_cp_devices(csv_reader, key, session)
+        failed = [result for result in results if result[3] is not None]
+        print('*** Added {}/{} devices in {} seconds ***'.format(
+            len(results) - len(failed), len(results), round(time.time() - startTime, 2)))
+        if failed:
+            print('*** Errors Encountered ***')
+            for result in failed:
+                print('{}, {}, {}, {}'.format(*result))
+    else:
+        for row in csv_reader:
+            # Where the first entry in the row is MAC and second entry is site number
+            add_cp_device(row[0], row[1], key)
@@ -0,0 +1 @@
+"""Shared helpers for the Aruba_Conf and aruba_operations fleet scripts."""
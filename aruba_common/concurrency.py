@@ -0,0 +1,121 @@
+"""AIMD concurrency control for the fleet engine.
+
+A fixed max_threads is too high for WAN branch controllers, which start
+timing out, and too low for the datacenter.  AdaptiveLimiter starts low and
+doubles the number of devices in flight every round of successful sessions
+(slow start) until the first sign of congestion; from then on it adds about
+one per round (additive increase).  It halves the limit (multiplicative
+decrease) when a session times out, fails to log in or connect, or when its
+login takes much longer than the fastest login seen so far.  Decreases are
+rate limited by a cooldown so one burst of failures only counts once.
+
+Limits can be kept per group, e.g. per site or per /24, on top of the
+overall ceiling, so one slow site is throttled without holding back the rest.
+"""
+import asyncio
+import socket
+import time
+
+CONGESTION_ERRORS = (asyncio.TimeoutError, TimeoutError, socket.timeout, ConnectionError)
+
+
+def is_congestion(error):
+    """True when an error suggests the network or controller is overloaded."""
+    if isinstance(error, CONGESTION_ERRORS):
+        return True
+    # netmiko's timeout and authentication exceptions, without importing netmiko
+    name = type(error).__name__.lower()
+    return 'timeout' in name or 'authentication' in name
+
+
+class _Group:
+    def __init__(self, limit):
+        self.limit = float(limit)
+        self.in_flight = 0
+        self.baseline = None
+        self.last_decrease = 0.0
+        self.slow_start = True
+
+
+class AdaptiveLimiter:
+    """Slow start, then additive-increase, multiplicative-decrease limit on devices in flight.
+
+    Args:
+        initial (int, optional): Starting limit per group. Defaults to 10.
+        minimum (int, optional): Lowest limit per group. Defaults to 1.
+        maximum (int, optional): Highest limit per group and overall. Defaults to 400.
+        group_of (callable, optional): Maps a hostname to its group, e.g.
+            metrics.site_from_hostname. Defaults to one group for everything.
+        backoff (float, optional): Factor applied to the limit on congestion. Defaults to 0.5.
+        latency_tolerance (float, optional): A login slower than this many times
+            the group's fastest login counts as congestion. Defaults to 3.0.
+        cooldown (float, optional): Seconds between two decreases of a group. Defaults to 5.0.
+    """
+
+    def __init__(self, initial=10, minimum=1, maximum=400, group_of=None, backoff=0.5,
+                 latency_tolerance=3.0, cooldown=5.0):
+        self.initial = min(max(initial, minimum), maximum)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.group_of = group_of or (lambda host: 'all')
+        self.backoff = backoff
+        self.latency_tolerance = latency_tolerance
+        self.cooldown = cooldown
+        self.groups = {}
+        self.in_flight = 0
+        self._connect_times = {}
+
+    def _group(self, host):
+        name = self.group_of(host)
+        if name not in self.groups:
+            self.groups[name] = _Group(self.initial)
+        return self.groups[name]
+
+    @property
+    def limits(self):
+        """Current limit of every group."""
+        return {name: int(group.limit) for name, group in self.groups.items()}
+
+    def try_acquire(self, host):
+        """Take a slot for host when its group and the overall ceiling have room.
+
+        Returns:
+            bool: False when host has to wait, run_fleet_async then tries other groups.
+        """
+        group = self._group(host)
+        if group.in_flight >= int(group.limit) or self.in_flight >= self.maximum:
+            return False
+        group.in_flight += 1
+        self.in_flight += 1
+        return True
+
+    def observe_connect(self, host, seconds):
+        """Record how long host took to log in; safe to call from worker threads."""
+        self._connect_times[host] = seconds
+
+    def release(self, result):
+        """Give back the slot of a finished DeviceResult and adjust its group's limit."""
+        group = self._group(result.host)
+        group.in_flight -= 1
+        self.in_flight -= 1
+        latency = self._connect_times.pop(result.host, None)
+        if not result.ok:
+            if is_congestion(result.error):
+                self._decrease(group)
+        elif latency is not None and group.baseline is not None \
+                and latency > group.baseline * self.latency_tolerance:
+            self._decrease(group)
+        else:
+            if latency is not None:
+                # Let the baseline creep up so one unusually fast login doesn't pin it forever
+                group.baseline = latency if group.baseline is None else min(group.baseline * 1.01, latency)
+            # One more per success doubles the limit every round while in slow start
+            group.limit = min(self.maximum, group.limit + (1.0 if group.slow_start else 1.0 / group.limit))
+
+    def _decrease(self, group):
+        now = time.monotonic()
+        if now - group.last_decrease < self.cooldown:
+            return
+        group.last_decrease = now
+        group.slow_start = False
+        group.limit = max(self.minimum, group.limit * self.backoff)
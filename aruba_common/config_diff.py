@@ -0,0 +1,191 @@
+"""Diff-aware config push: only send the lines a controller is missing.
+
+Most bulk pushes re-apply config that is already there.  push_missing()
+reads the device's running-config (or a recent cached copy), works out which
+of the queued lines are not in it yet, sends only those and skips
+``write mem`` when nothing had to change.
+
+ArubaOS config is one level deep: a top level line such as
+``aaa profile "corp"`` is followed by its indented sub-commands.  The queued
+lines are split into blocks of a context line and its sub-commands.  When the
+queued lines mark where a context ends (indented sub-commands, or ``!`` /
+``exit`` lines) only the missing sub-commands are sent, behind their context
+line.  Lines from a CSV are usually flat, so a new context cannot be told
+apart from a sub-command of the one before; there a block runs from one
+existing top level line to the next and is sent whole when any of it is
+missing.
+"""
+import os
+import time
+
+from aruba_common.metrics import stage
+
+CONTEXT_END = ('!', 'exit', 'end')
+
+
+def parse_running_config(running_config):
+    """Split running-config into {top level line: set of its sub-command lines}."""
+    sections = {}
+    current = None
+    for line in running_config.splitlines():
+        stripped = line.strip()
+        if not stripped or stripped in CONTEXT_END:
+            if not line.startswith(' '):
+                current = None
+            continue
+        if line[0].isspace() and current is not None:
+            sections[current].add(stripped)
+        else:
+            current = stripped
+            sections.setdefault(current, set())
+    return sections
+
+
+def _configured(negated, lines):
+    """True when one of lines sets what 'no negated' removes, e.g. 'no ip address' and 'ip address 10.0.0.1 ...'."""
+    return any(line == negated or line.startswith(negated + ' ') for line in lines)
+
+
+def _present(stripped, existing, top_level=()):
+    """True when a queued line is already in existing, or is a 'no' for something absent."""
+    if stripped.startswith('no '):
+        return not _configured(stripped[3:], existing) and not _configured(stripped[3:], top_level)
+    return stripped in existing
+
+
+def _explicit_blocks(lines):
+    """Split lines into [context, sub-commands, end] by indentation or '!'/exit lines."""
+    indented = any(line[0].isspace() for line in lines)
+    blocks = []
+    block = None
+    for line in lines:
+        stripped = line.strip()
+        if stripped in CONTEXT_END:
+            if block is not None:
+                block[2] = line
+            block = None
+        elif block is None or (indented and not line[0].isspace()):
+            block = [line if not line[0].isspace() else None, [], None]
+            if block[0] is None:
+                block[1].append(line)
+            blocks.append(block)
+        else:
+            block[1].append(line)
+    return blocks
+
+
+def _flat_blocks(lines, sections):
+    """Split unindented lines into blocks that each start at an existing top level line."""
+    blocks = []
+    block = None
+    for line in lines:
+        if line.strip() in sections or block is None:
+            block = [line if line.strip() in sections else None, [], None]
+            if block[0] is None:
+                block[1].append(line)
+            blocks.append(block)
+        else:
+            block[1].append(line)
+    return blocks
+
+
+def missing_lines(config_lines, running_config):
+    """Return the lines of config_lines that running_config does not have yet.
+
+    Args:
+        config_lines (list): Config lines as they would be passed to send_config_set.
+        running_config (str): Output of show running-config.
+
+    Returns:
+        list: Lines to send, with the context line repeated in front of
+            missing sub-commands. Empty when the device is compliant.
+    """
+    sections = parse_running_config(running_config)
+    lines = [line for line in config_lines if line.strip()]
+    explicit = any(line[0].isspace() or line.strip() in CONTEXT_END for line in lines)
+    missing = []
+    if explicit:
+        for context, sub_commands, end in _explicit_blocks(lines):
+            if context is not None and context.strip() in sections:
+                existing = sections[context.strip()]
+                to_send = [line for line in sub_commands if not _present(line.strip(), existing)]
+                if not to_send:
+                    continue
+            elif context is None:
+                to_send = [line for line in sub_commands if not _present(line.strip(), sections)]
+                if not to_send:
+                    continue
+            else:
+                to_send = sub_commands
+            if context is not None:
+                missing.append(context)
+            missing.extend(to_send)
+            if end is not None:
+                missing.append(end)
+        return missing
+    for context, sub_commands, _ in _flat_blocks(lines, sections):
+        if context is None:
+            # Starts with a line the device doesn't have, which may open a new context
+            if not all(_present(line.strip(), sections) for line in sub_commands):
+                missing.extend(sub_commands)
+            continue
+        existing = sections[context.strip()]
+        if not all(_present(line.strip(), existing, sections) for line in sub_commands):
+            missing.append(context)
+            missing.extend(sub_commands)
+    return missing
+
+
+def running_config(ssh_session, host, cache_dir=None, max_age=3600):
+    """Return host's running-config, from cache_dir when a fresh enough copy exists.
+
+    Args:
+        ssh_session: Open netmiko session to host.
+        host (str): Hostname, used for the cache file name.
+        cache_dir (str, optional): Directory of cached running-configs, None to always fetch. Defaults to None.
+        max_age (int, optional): Seconds a cached copy is trusted. Defaults to 3600.
+
+    Returns:
+        str: The running-config text.
+    """
+    cache_file = os.path.join(cache_dir, host + '.cfg') if cache_dir else None
+    if cache_file and os.path.exists(cache_file) and time.time() - os.path.getmtime(cache_file) < max_age:
+        with open(cache_file) as cached:
+            return cached.read()
+    with stage('fetch_config'):
+        output = ssh_session.send_command('show running-config')
+    if cache_file:
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(cache_file, 'w') as cached:
+            cached.write(output)
+    return output
+
+
+def push_missing(ssh_session, host, config_lines, write_mem=True, cache_dir=None, max_age=3600):
+    """Send only the missing config lines and write mem only when something changed.
+
+    Args:
+        ssh_session: Open netmiko session to host.
+        host (str): Hostname the session is connected to.
+        config_lines (list): Config lines to make sure are present.
+        write_mem (bool, optional): Save the config after a change. Defaults to True.
+        cache_dir (str, optional): Running-config cache directory, see running_config. Defaults to None.
+        max_age (int, optional): Seconds a cached running-config is trusted. Defaults to 3600.
+
+    Returns:
+        list: Lines that were sent, empty when the device was already compliant.
+    """
+    to_send = missing_lines(config_lines, running_config(ssh_session, host, cache_dir, max_age))
+    if not to_send:
+        return to_send
+    with stage('config'):
+        ssh_session.send_config_set(to_send)
+    if write_mem:
+        with stage('write_mem'):
+            ssh_session.send_command('write mem')
+    if cache_dir:
+        # The cached copy no longer matches the device
+        cache_file = os.path.join(cache_dir, host + '.cfg')
+        if os.path.exists(cache_file):
+            os.remove(cache_file)
+    return to_send
@@ -0,0 +1,75 @@
+"""Stream hostname,conf CSV files as [hostname, [conf, ...]] work items.
+
+csv_conf_multi.py and cpsec_conf.py used to load the whole file into a dict
+before queueing anything.  grouped_rows() yields each host as soon as its
+group of rows is complete, so the first sessions start straight away and
+memory no longer grows with the file.
+
+By default rows are spilled to temporary bucket files by hostname hash and
+each bucket is grouped in memory, so only 1/buckets of the file is held at a
+time and a host's rows are merged wherever they are in the file.  Input known
+to be sorted (all rows for a host next to each other) can be streamed in one
+pass with ``sorted_input=True``, which starts the first sessions sooner.
+"""
+import csv
+import os
+import tempfile
+import zlib
+from itertools import groupby
+from operator import itemgetter
+
+
+def grouped_rows(path, key='hostname', value='conf', sorted_input=False, buckets=64):
+    """Yield [hostname, [conf, ...]] for every host in a CSV file.
+
+    Args:
+        path (str): CSV file with a header row.
+        key (str, optional): Column holding the hostname. Defaults to 'hostname'.
+        value (str, optional): Column holding the config line. Defaults to 'conf'.
+        sorted_input (bool, optional): True when each host's rows are contiguous.
+            A host that shows up again later in a "sorted" file is queued again
+            with its later rows, as a second session with partial config, and
+            a warning is printed. Defaults to False.
+        buckets (int, optional): Spill files used for unsorted input. Defaults to 64.
+
+    Yields:
+        list: [hostname, list of conf lines], conf lines in file order.
+    """
+    if sorted_input:
+        yield from _grouped_sorted(path, key, value)
+    else:
+        yield from _grouped_spilled(path, key, value, buckets)
+
+
+def _grouped_sorted(path, key, value):
+    seen = set()
+    with open(path, newline='') as file:
+        rows = ((row[key], row[value]) for row in csv.DictReader(file))
+        for hostname, group in groupby(rows, key=itemgetter(0)):
+            if hostname in seen:
+                print('WARNING: {} appears more than once in {}, queueing it again'.format(hostname, path))
+            seen.add(hostname)
+            yield [hostname, [conf for _, conf in group]]
+
+
+def _grouped_spilled(path, key, value, buckets):
+    with tempfile.TemporaryDirectory(prefix='csv_groups_') as spill_dir:
+        spill_paths = [os.path.join(spill_dir, '{}.csv'.format(num)) for num in range(buckets)]
+        spill_files = [open(spill_path, 'w', newline='') for spill_path in spill_paths]
+        try:
+            writers = [csv.writer(spill_file) for spill_file in spill_files]
+            with open(path, newline='') as file:
+                for row in csv.DictReader(file):
+                    hostname = row[key]
+                    writers[zlib.crc32(hostname.encode()) % buckets].writerow([hostname, row[value]])
+        finally:
+            for spill_file in spill_files:
+                spill_file.close()
+
+        for spill_path in spill_paths:
+            conf_dict = {}
+            with open(spill_path, newline='') as spill_file:
+                for hostname, conf in csv.reader(spill_file):
+                    conf_dict.setdefault(hostname, []).append(conf)
+            for hostname, conf_list in conf_dict.items():
+                yield [hostname, conf_list]
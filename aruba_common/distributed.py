@@ -0,0 +1,388 @@
+"""Spread one fleet run over several worker processes or jump hosts.
+
+One box tops out at about max_threads sessions.  With --coordinator a script
+only serves its work items over TCP, leasing them out as they are read from
+the source; each copy of the same script started with --worker HOST:PORT
+leases items from it, runs them through its own run_sessions (with its own
+limiter and thread pool) and sends the results back.  The coordinator prints the report and keeps the journal as if the run
+had been local.
+
+    python3 aruba_write_mem.py --coordinator 0.0.0.0:8765
+    python3 aruba_write_mem.py --worker coordinator-host:8765   (on each jump host)
+
+Protocol: one JSON object per line.  A worker asks for a batch of leases,
+sends a heartbeat with the leases it holds every ``heartbeat`` seconds and a
+result per lease.  A lease that is not renewed within ``lease_timeout``, or
+whose worker disconnects, goes back to the queue; an item is failed after
+``max_attempts`` lost leases.  Items and outputs must be JSON serializable
+(outputs that are not are sent as their repr).
+"""
+import asyncio
+import collections
+import json
+import os
+import socket
+import sys
+import time
+
+from aruba_common.engine import DeviceResult, FleetReport, host_of, run_sessions
+
+_error_types = {}
+
+
+class RemoteError(Exception):
+    """Exception raised on a worker, rebuilt on the coordinator under its original class name."""
+
+
+def remote_error(kind, message):
+    """Return a RemoteError subclass instance named kind, so is_congestion and metrics still see it."""
+    if kind not in _error_types:
+        _error_types[kind] = type(kind, (RemoteError,), {})
+    return _error_types[kind](message)
+
+
+def parse_address(address, default_host='0.0.0.0'):
+    """Split 'host:port' (or ':port') into (host, port)."""
+    host, _, port = address.rpartition(':')
+    return host or default_host, int(port)
+
+
+async def _send(writer, message):
+    writer.write(json.dumps(message, default=repr).encode() + b'\n')
+    await writer.drain()
+
+
+class Coordinator:
+    """Hands items out to workers as leases and collects their results.
+
+    Args:
+        items (iterable): Work items, a plain or async iterable as for run_sessions.
+        address (str, optional): 'host:port' to listen on. Defaults to '0.0.0.0:8765'.
+        key (callable, optional): Maps an item to its hostname. Defaults to host_of.
+        lease_timeout (float, optional): Seconds a lease lasts without a heartbeat. Defaults to 60.
+        max_attempts (int, optional): Lost leases before an item is failed. Defaults to 3.
+        journal (RunJournal, optional): Records results; when resuming, done hosts
+            are not handed out. Defaults to None.
+        metrics (FleetMetrics, optional): Collects the stage timings workers send back. Defaults to None.
+        verbose (bool, optional): Print lease and result progress. Defaults to True.
+        buffer (int, optional): Items read ahead of the workers' leases; reading
+            the source pauses while this many are waiting. Defaults to 10000.
+    """
+
+    def __init__(self, items, address='0.0.0.0:8765', key=host_of, lease_timeout=60, max_attempts=3,
+                 journal=None, metrics=None, verbose=True, buffer=10000):
+        self.address = parse_address(address)
+        self.key = key
+        self.lease_timeout = lease_timeout
+        self.max_attempts = max_attempts
+        self.journal = journal
+        self.metrics = metrics
+        self.verbose = verbose
+        self.buffer = buffer
+        self.source = items
+        self.items = []
+        self.skipped = []
+        self.pending = collections.deque()
+        self.attempts = []
+        self.leases = {}
+        self.results = {}
+        self._next_lease = 0
+        self._finished = None
+        self._loaded = False
+        self._load_error = None
+        self._drained = None
+        self._connections = {}
+
+    def _finish(self, index, result):
+        if index in self.results:
+            # A lease that expired but still came back, the first result wins
+            return
+        self.results[index] = result
+        if self.journal is not None:
+            self.journal.record(result)
+        if self.metrics is not None:
+            self.metrics.record(result)
+        if self.verbose:
+            print('{}: {}'.format(result.host, 'done' if result.ok else result.error))
+        self._check_finished()
+
+    def _check_finished(self):
+        if self._loaded and len(self.results) == len(self.items):
+            self._finished.set()
+
+    def _requeue(self, lease_id, reason):
+        index, worker, _ = self.leases.pop(lease_id)
+        if index in self.results:
+            return
+        self.attempts[index] += 1
+        if self.attempts[index] >= self.max_attempts:
+            item = self.items[index]
+            self._finish(index, DeviceResult(self.key(item), item, False, error=remote_error(
+                'LeaseLost', '{} lost {} times, last by {}'.format(reason, self.attempts[index], worker))))
+        else:
+            if self.verbose:
+                print('Requeueing {}, {} by {}'.format(self.key(self.items[index]), reason, worker))
+            self.pending.appendleft(index)
+
+    async def _reap(self):
+        while True:
+            await asyncio.sleep(min(self.lease_timeout / 4, 5))
+            now = time.monotonic()
+            for lease_id, (_, worker, expires) in list(self.leases.items()):
+                if expires < now:
+                    self._requeue(lease_id, 'lease expired')
+
+    def _lease(self, worker, count):
+        leases = []
+        expires = time.monotonic() + self.lease_timeout
+        while self.pending and len(leases) < count:
+            index = self.pending.popleft()
+            self._next_lease += 1
+            self.leases[self._next_lease] = (index, worker, expires)
+            leases.append([self._next_lease, self.items[index]])
+        if len(self.pending) < self.buffer // 2:
+            self._drained.set()
+        return leases
+
+    async def _handle(self, reader, writer):
+        worker = None
+        self._connections[writer] = asyncio.current_task()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                message = json.loads(line)
+                op = message['op']
+                if op == 'hello':
+                    worker = message['worker']
+                    if self.verbose:
+                        print('Worker {} connected'.format(worker))
+                elif op == 'lease':
+                    leases = self._lease(worker, message['count'])
+                    if leases:
+                        await _send(writer, {'op': 'leases', 'leases': leases})
+                    elif self._finished.is_set():
+                        await _send(writer, {'op': 'done'})
+                    else:
+                        # Everything is leased, but leases may still come back
+                        await _send(writer, {'op': 'wait'})
+                elif op == 'heartbeat':
+                    expires = time.monotonic() + self.lease_timeout
+                    for lease_id in message['leases']:
+                        if lease_id in self.leases:
+                            index, _, _ = self.leases[lease_id]
+                            self.leases[lease_id] = (index, worker, expires)
+                elif op == 'result':
+                    lease = self.leases.pop(message['lease'], None)
+                    if lease is None:
+                        continue
+                    index = lease[0]
+                    item = self.items[index]
+                    error = None if message['ok'] else remote_error(message['error_type'], message['error'])
+                    if self.metrics is not None:
+                        timer = self.metrics.timer(self.key(item))
+                        for name, seconds in message.get('stages', {}).items():
+                            timer.add(name, seconds)
+                    self._finish(index, DeviceResult(self.key(item), item, message['ok'],
+                                                     output=message.get('output'), error=error,
+                                                     elapsed=message['elapsed']))
+        except (ConnectionError, ValueError, KeyError) as e:
+            if self.verbose:
+                print('Worker {} dropped: {}'.format(worker, e))
+        finally:
+            for lease_id, (_, lease_worker, _) in list(self.leases.items()):
+                if lease_worker == worker:
+                    self._requeue(lease_id, 'worker disconnected')
+            self._connections.pop(writer, None)
+            writer.close()
+
+    async def _add(self, item):
+        if self.journal is not None and self.journal.resume and self.journal.succeeded(item):
+            self.skipped.append(self.key(item))
+            return
+        self.items.append(item)
+        self.attempts.append(0)
+        self.pending.append(len(self.items) - 1)
+        if len(self.pending) >= self.buffer:
+            # Let the workers catch up before reading further
+            self._drained.clear()
+            await self._drained.wait()
+        elif len(self.items) % 100 == 0:
+            # A plain iterable never yields to the event loop by itself
+            await asyncio.sleep(0)
+
+    async def _load(self):
+        """Read the source into the lease queue while workers are already being served."""
+        try:
+            if hasattr(self.source, '__aiter__'):
+                async for item in self.source:
+                    await self._add(item)
+            else:
+                for item in self.source:
+                    await self._add(item)
+        except Exception as e:
+            self._load_error = e
+            self._finished.set()
+        finally:
+            self._loaded = True
+            self._check_finished()
+        if self.verbose:
+            print('Coordinator read {} items, {} skipped'.format(len(self.items), len(self.skipped)))
+
+    async def serve(self):
+        """Serve leases until every item has a result.
+
+        Returns:
+            FleetReport: One DeviceResult per item, skipped hosts as in run_fleet.
+        """
+        start_time = time.monotonic()
+        self._finished = asyncio.Event()
+        self._drained = asyncio.Event()
+        server = await asyncio.start_server(self._handle, *self.address)
+        if self.verbose:
+            print('Coordinator listening on {}:{}'.format(self.address[0], server.sockets[0].getsockname()[1]))
+        loader = asyncio.ensure_future(self._load())
+        reaper = asyncio.ensure_future(self._reap())
+        try:
+            await self._finished.wait()
+        finally:
+            loader.cancel()
+            reaper.cancel()
+            server.close()
+            # Workers read the closed connection as "nothing left"
+            for writer in list(self._connections):
+                writer.close()
+            await asyncio.gather(*self._connections.values(), return_exceptions=True)
+        if self._load_error is not None:
+            raise self._load_error
+        results = [self.results[index] for index in sorted(self.results)]
+        return FleetReport(results, time.monotonic() - start_time, self.skipped)
+
+
+class RemoteQueue:
+    """Worker side: an async item source leasing from a Coordinator.
+
+    Passed to run_sessions as both the items and the journal, so results go
+    back to the coordinator as the engine records them.
+
+    Args:
+        address (str): Coordinator 'host:port'.
+        name (str, optional): Worker name in the coordinator's output. Defaults to hostname:pid.
+        batch (int, optional): Leases asked for at a time. Defaults to 10.
+        heartbeat (float, optional): Seconds between heartbeats. Defaults to 10.
+        metrics (FleetMetrics, optional): Stage timings of this worker, sent with each result. Defaults to None.
+        key (callable, optional): Maps an item to its hostname. Defaults to host_of.
+        connect_timeout (float, optional): Seconds to keep retrying while the
+            coordinator is not listening yet. Defaults to 30.
+    """
+
+    # Journal interface for run_fleet_async, the coordinator does the resuming
+    resume = False
+
+    def __init__(self, address, name=None, batch=10, heartbeat=10, metrics=None, key=host_of,
+                 connect_timeout=30):
+        self.address = parse_address(address, default_host='127.0.0.1')
+        self.name = name or '{}:{}'.format(socket.gethostname(), os.getpid())
+        self.batch = batch
+        self.heartbeat = heartbeat
+        self.metrics = metrics
+        self.key = key
+        self.connect_timeout = connect_timeout
+        # Lease ids by hostname, a host can be queued more than once
+        self.held = collections.defaultdict(collections.deque)
+        self._writer = None
+
+    def succeeded(self, item):
+        return False
+
+    async def _heartbeats(self):
+        while True:
+            await asyncio.sleep(self.heartbeat)
+            leases = [lease_id for lease_ids in self.held.values() for lease_id in lease_ids]
+            await _send(self._writer, {'op': 'heartbeat', 'leases': leases})
+
+    async def _connect(self):
+        deadline = time.monotonic() + self.connect_timeout
+        while True:
+            try:
+                return await asyncio.open_connection(*self.address)
+            except OSError:
+                if time.monotonic() >= deadline:
+                    raise
+                await asyncio.sleep(0.5)
+
+    async def items(self):
+        """Yield leased items until the coordinator has none left."""
+        reader, self._writer = await self._connect()
+        await _send(self._writer, {'op': 'hello', 'worker': self.name})
+        heartbeats = asyncio.ensure_future(self._heartbeats())
+        delay = 0.1
+        try:
+            while True:
+                try:
+                    await _send(self._writer, {'op': 'lease', 'count': self.batch})
+                    line = await reader.readline()
+                except ConnectionError:
+                    line = b''
+                if not line:
+                    # The coordinator finished and closed the connection
+                    break
+                reply = json.loads(line)
+                if reply['op'] == 'done':
+                    break
+                if reply['op'] == 'wait':
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, 5)
+                    continue
+                delay = 0.1
+                for lease_id, item in reply['leases']:
+                    self.held[self.key(item)].append(lease_id)
+                    yield item
+        finally:
+            heartbeats.cancel()
+
+    def record(self, result):
+        """Send a DeviceResult back to the coordinator (the engine's journal hook)."""
+        lease_id = self.held[result.host].popleft()
+        message = {'op': 'result', 'lease': lease_id, 'ok': result.ok, 'output': result.output,
+                   'elapsed': round(result.elapsed, 3)}
+        if result.error is not None:
+            message['error_type'] = type(result.error).__name__
+            message['error'] = str(result.error)
+        if self.metrics is not None:
+            message['stages'] = dict(self.metrics.timer(result.host).stages)
+        self._writer.write(json.dumps(message, default=repr).encode() + b'\n')
+
+
+def fleet_role(argv=None):
+    """Return ('coordinator' or 'worker', address) from --coordinator/--worker ADDRESS, else (None, None)."""
+    argv = sys.argv if argv is None else argv
+    for flag in ('--coordinator', '--worker'):
+        if flag in argv:
+            return flag[2:], argv[argv.index(flag) + 1]
+    return None, None
+
+
+def run_distributed(items, task, username, password, key=host_of, journal=None, metrics=None,
+                    argv=None, **kwargs):
+    """run_sessions, or its coordinator or worker half when the script was started with one of the flags.
+
+    Takes the same arguments as run_sessions.  As coordinator, items are
+    served and the report covers every worker's results.  As worker, items
+    and journal are ignored and the report covers this worker's devices.
+    """
+    role, address = fleet_role(argv)
+    if role == 'coordinator':
+        coordinator = Coordinator(items, address, key=key, journal=journal, metrics=metrics,
+                                  verbose=kwargs.get('verbose', True))
+        return asyncio.run(coordinator.serve())
+    if role == 'worker':
+        remote = RemoteQueue(address, metrics=metrics, key=key)
+        # Lease a batch at a time as slots free up, so workers that connect
+        # later still get a share of the fleet
+        kwargs.setdefault('lookahead', remote.batch)
+        return run_sessions(remote.items(), task, username, password, key=key,
+                            journal=remote, metrics=metrics, **kwargs)
+    return run_sessions(items, task, username, password, key=key, journal=journal,
+                        metrics=metrics, **kwargs)
@@ -0,0 +1,334 @@
+"""Shared asyncio fan-out engine for the Aruba fleet scripts.
+
+Every script used to start its own pool of daemon threads looping forever on
+a Queue.  They now hand the engine an iterable of work items and a task; the
+engine keeps at most ``max_concurrency`` devices in flight, applies a
+per-device timeout and returns one DeviceResult per item.
+
+netmiko is blocking, so synchronous tasks run on a thread pool sized to the
+concurrency limit.  Coroutine tasks are awaited directly on the event loop,
+which lets an async SSH client plug in without any change to the engine.
+"""
+import asyncio
+import collections
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+from aruba_common.metrics import timing
+
+_STOP = object()
+
+
+class _AdmissionQueue:
+    """Work queue handing out the oldest item the limiter has room for.
+
+    A worker that took an item off a plain queue and then waited for its
+    site's slot would hold a whole worker for a capped site while other sites
+    sit in the queue behind it.  Items are kept per group instead and get()
+    only returns one once limiter.try_acquire() admitted it, taking groups in
+    turn.  Up to ``lookahead`` items are read ahead of the workers, so a file
+    sorted by site still reaches the other sites.
+    """
+
+    def __init__(self, limiter, key, lookahead):
+        self.limiter = limiter
+        self.key = key
+        self.lookahead = lookahead
+        self.groups = collections.OrderedDict()
+        self.size = 0
+        self.closed = False
+        self.changed = asyncio.Condition()
+
+    async def put(self, entry):
+        async with self.changed:
+            await self.changed.wait_for(lambda: self.size < self.lookahead)
+            self.groups.setdefault(self.limiter.group_of(self.key(entry[0])), collections.deque()).append(entry)
+            self.size += 1
+            self.changed.notify_all()
+
+    async def close(self):
+        async with self.changed:
+            self.closed = True
+            self.changed.notify_all()
+
+    async def notify(self):
+        """Wake the workers after the limiter gave a slot back."""
+        async with self.changed:
+            self.changed.notify_all()
+
+    def _take(self):
+        if self.size and self.limiter.in_flight >= self.limiter.maximum:
+            return None
+        for group, entries in self.groups.items():
+            if self.limiter.try_acquire(self.key(entries[0][0])):
+                entry = entries.popleft()
+                del self.groups[group]
+                if entries:
+                    # Back of the line, so the other groups get the next free slots
+                    self.groups[group] = entries
+                self.size -= 1
+                self.changed.notify_all()
+                return entry
+        if self.closed and not self.size:
+            return _STOP
+        return None
+
+    async def get(self):
+        async with self.changed:
+            return await self.changed.wait_for(self._take)
+
+
+@dataclass
+class DeviceResult:
+    """Outcome of one work item.
+
+    Attributes:
+        host (str): Hostname or IP the item was run against.
+        item: The work item as it was queued.
+        ok (bool): True when the task returned without raising.
+        output: Whatever the task returned.
+        error (Exception): Exception raised by the task, including timeouts.
+        elapsed (float): Seconds spent on the device.
+    """
+    host: str
+    item: Any
+    ok: bool
+    output: Any = None
+    error: Optional[BaseException] = None
+    elapsed: float = 0.0
+
+
+@dataclass
+class FleetReport:
+    """All DeviceResults of a run plus the total wall clock time.
+
+    ``skipped`` holds the hostnames a resumed run left out because the
+    journal already had them as done.
+    """
+    results: list
+    elapsed: float
+    skipped: list = field(default_factory=list)
+
+    @property
+    def succeeded(self):
+        return [result for result in self.results if result.ok]
+
+    @property
+    def failed(self):
+        return [result for result in self.results if not result.ok]
+
+
+def host_of(item):
+    """Default host extractor: items are a hostname or [hostname, payload]."""
+    if isinstance(item, str):
+        return item
+    return item[0]
+
+
+async def run_fleet_async(items, task, max_concurrency=100, timeout=None,
+                          key=host_of, verbose=True, journal=None, metrics=None,
+                          limiter=None, lookahead=10000):
+    """Run task(item) for every item with bounded concurrency.
+
+    Args:
+        items (iterable): Work items, a plain or async iterable.  Items are
+            pulled lazily so a streaming source starts work immediately.
+        task (callable): Function or coroutine function taking one item.
+        max_concurrency (int, optional): Devices in flight at once. Defaults to 100.
+        timeout (float, optional): Per-device timeout in seconds. Defaults to None.
+        key (callable, optional): Maps an item to its hostname. Defaults to host_of.
+        verbose (bool, optional): Print queue/worker progress. Defaults to True.
+        journal (RunJournal, optional): Records every result; when resuming,
+            items it has as done are skipped. Defaults to None.
+        metrics (FleetMetrics, optional): Collects queue wait and per-device
+            timings. Defaults to None.
+        limiter (AdaptiveLimiter, optional): Adjusts the devices in flight
+            between its minimum and maximum instead of a fixed
+            max_concurrency, which is ignored.  Items wait in the queue
+            until their group has room, so other groups go first. Defaults to None.
+        lookahead (int, optional): Items read ahead of the workers when a
+            limiter is set, about one lease batch for a --worker. Defaults to 10000.
+
+    Returns:
+        FleetReport: One DeviceResult per item, in completion order.
+    """
+    loop = asyncio.get_running_loop()
+    if limiter is not None:
+        max_concurrency = limiter.maximum
+        queue = _AdmissionQueue(limiter, key, max(lookahead, 1))
+    else:
+        queue = asyncio.Queue(maxsize=max_concurrency * 2)
+    results = []
+    skipped = []
+    is_coroutine = asyncio.iscoroutinefunction(task)
+    executor = None if is_coroutine else ThreadPoolExecutor(max_workers=max_concurrency)
+    start_time = time.monotonic()
+
+    async def producer():
+        try:
+            if hasattr(items, '__aiter__'):
+                async for item in items:
+                    await put(item)
+            else:
+                for item in items:
+                    await put(item)
+        finally:
+            if limiter is not None:
+                await queue.close()
+            else:
+                for _ in range(max_concurrency):
+                    await queue.put(_STOP)
+
+    async def put(item):
+        if journal is not None and journal.resume and journal.succeeded(item):
+            skipped.append(key(item))
+            if verbose:
+                print('Skipping {}, done in an earlier run'.format(key(item)))
+            return
+        if verbose:
+            print('Putting {} in queue'.format(key(item)))
+        await queue.put((item, time.monotonic()))
+
+    async def worker(worker_num):
+        while True:
+            queued = await queue.get()
+            if queued is _STOP:
+                return
+            item, queued_at = queued
+            host = key(item)
+            if verbose:
+                print('{}: Working on "{}"'.format(worker_num, host))
+            started = time.monotonic()
+            if metrics is not None:
+                metrics.timer(host).add('queue_wait', started - queued_at)
+            try:
+                if is_coroutine:
+                    pending = task(item)
+                else:
+                    pending = loop.run_in_executor(executor, task, item)
+                output = await asyncio.wait_for(pending, timeout)
+                result = DeviceResult(host, item, True, output=output)
+            except Exception as e:
+                result = DeviceResult(host, item, False, error=e)
+            result.elapsed = time.monotonic() - started
+            results.append(result)
+            if limiter is not None:
+                limiter.release(result)
+                await queue.notify()
+            if journal is not None:
+                journal.record(result)
+            if metrics is not None:
+                metrics.record(result)
+
+    try:
+        await asyncio.gather(producer(), *[worker(num) for num in range(max_concurrency)])
+    finally:
+        if executor is not None:
+            # Timed out netmiko calls cannot be interrupted; don't wait on them here.
+            executor.shutdown(wait=False)
+    return FleetReport(results, time.monotonic() - start_time, skipped)
+
+
+def run_fleet(items, task, **kwargs):
+    """Blocking wrapper around run_fleet_async for the scripts."""
+    return asyncio.run(run_fleet_async(items, task, **kwargs))
+
+
+def aruba_device(host, username, password, **extra):
+    """Build the netmiko connection dictionary for an ArubaOS controller."""
+    router = {'device_type': 'aruba_os',
+              'ip': host,
+              'username': username,
+              'password': password,
+              'verbose': False}
+    router.update(extra)
+    return router
+
+
+def open_session(host, username, password, **extra):
+    """Open a netmiko session to an ArubaOS controller."""
+    import netmiko
+    return netmiko.ConnectHandler(**aruba_device(host, username, password, **extra))
+
+
+def run_sessions(items, task, username, password, key=host_of, timeout=None,
+                 session_options=None, metrics=None, limiter=None, **kwargs):
+    """Open one SSH session per item, run task(session, item), then disconnect.
+
+    Args:
+        items (iterable): Work items, see run_fleet_async.
+        task (callable): Function taking (netmiko session, item).
+        username (str): Controller username.
+        password (str): Controller password.
+        key (callable, optional): Maps an item to its hostname. Defaults to host_of.
+        timeout (float, optional): Per-device timeout in seconds, also handed
+            to netmiko so a hung read gives its thread back. Defaults to None.
+        session_options (dict, optional): Extra netmiko ConnectHandler
+            arguments, e.g. {'port': 8022}. Defaults to None.
+        metrics (FleetMetrics, optional): Times the tcp_connect, ssh_login,
+            command and disconnect stages of every device. Defaults to None.
+        limiter (AdaptiveLimiter, optional): Sets the devices in flight from
+            login times and failures, see run_fleet_async. Defaults to None.
+
+    Returns:
+        FleetReport: One DeviceResult per item.
+    """
+    extra = {'timeout': timeout, 'conn_timeout': timeout} if timeout else {}
+    extra.update(session_options or {})
+
+    def session_task(item):
+        started = time.monotonic()
+        ssh_session = open_session(key(item), username, password, **extra)
+        if limiter is not None:
+            limiter.observe_connect(key(item), time.monotonic() - started)
+        try:
+            return task(ssh_session, item)
+        finally:
+            ssh_session.disconnect()
+
+    def timed_session_task(item):
+        host = key(item)
+        timer = metrics.timer(host)
+        with timing(timer):
+            started = time.monotonic()
+            # Connect the socket here so TCP time is kept apart from the SSH login
+            with timer.stage('tcp_connect'):
+                sock = socket.create_connection((host, extra.get('port', 22)), timeout)
+            with timer.stage('ssh_login'):
+                ssh_session = open_session(host, username, password, sock=sock, **extra)
+            if limiter is not None:
+                limiter.observe_connect(host, time.monotonic() - started)
+            try:
+                with timer.stage('command'):
+                    return task(ssh_session, item)
+            finally:
+                with timer.stage('disconnect'):
+                    ssh_session.disconnect()
+
+    return run_fleet(items, timed_session_task if metrics else session_task, key=key,
+                     timeout=timeout, metrics=metrics, limiter=limiter, **kwargs)
+
+
+def check_credentials(username, password):
+    """Test the user's credentials with an SSH login to localhost.
+
+    Returns:
+        bool: True when the login succeeded.
+    """
+    import netmiko
+    from netmiko import NetMikoTimeoutException, NetMikoAuthenticationException
+    try:
+        test_device = {'device_type': 'linux', 'ip': 'localhost',
+                       'username': username, 'password': password}
+        ssh_session = netmiko.ConnectHandler(**test_device)
+        ssh_session.disconnect()
+        return True
+    except NetMikoAuthenticationException:
+        print('Username or Password Error')
+        return False
+    except NetMikoTimeoutException:
+        print('Localhost timeout')
+        return False
@@ -0,0 +1,115 @@
+"""Streaming, cached SolarWinds (Orion SWIS) inventory source.
+
+aruba_clear_blacklist_clients.py used to block on one big SWIS query before
+queueing anything.  SwisInventory pages through Orion.Nodes by NodeID and
+yields each hostname as its page arrives, so the engine starts sessions while
+later pages are still loading.
+
+The node list is cached in a JSON file.  Within ``ttl`` the cache is used as
+is and Orion is not queried at all.  After that only nodes with a NodeID above
+the highest cached one are fetched (new nodes get increasing IDs), and every
+``full_refresh`` seconds the list is rebuilt from scratch to drop removed or
+renamed nodes.  If Orion fails, the cached list is used with a warning.
+"""
+import asyncio
+import json
+import os
+import time
+
+PAGE_QUERY = ('SELECT TOP {page_size} NodeID, NodeName FROM Orion.Nodes N '
+              'WHERE ({where}) AND NodeID > @last_id ORDER BY NodeID')
+
+
+class SwisInventory:
+    """Hostnames from Orion.Nodes, streamed page by page with a local cache.
+
+    Args:
+        swis (SwisClient): Connected orionsdk client.
+        where (str, optional): SWQL filter on Orion.Nodes N. Defaults to aruba nodes.
+        cache_file (str, optional): JSON cache of the node list, None to disable. Defaults to None.
+        ttl (int, optional): Seconds the cache is used without asking Orion. Defaults to 3600.
+        full_refresh (int, optional): Seconds between full rebuilds of the cache. Defaults to 86400.
+        page_size (int, optional): Nodes per SWIS query. Defaults to 500.
+    """
+
+    def __init__(self, swis, where="NodeName LIKE 'aruba%'", cache_file=None, ttl=3600,
+                 full_refresh=86400, page_size=500):
+        self.swis = swis
+        self.where = where
+        self.cache_file = cache_file
+        self.ttl = ttl
+        self.full_refresh = full_refresh
+        self.page_size = page_size
+
+    def _load_cache(self):
+        if not self.cache_file or not os.path.exists(self.cache_file):
+            return None
+        try:
+            with open(self.cache_file) as cache:
+                cached = json.load(cache)
+        except ValueError:
+            return None
+        if cached.get('where') != self.where:
+            return None
+        return cached
+
+    def _save_cache(self, nodes, full_at):
+        if not self.cache_file:
+            return
+        cached = {'where': self.where,
+                  'refreshed_at': time.time(),
+                  'full_at': full_at,
+                  'nodes': [[node_id, name] for node_id, name in sorted(nodes.items())]}
+        temp_file = self.cache_file + '.tmp'
+        with open(temp_file, 'w') as cache:
+            json.dump(cached, cache)
+        os.replace(temp_file, self.cache_file)
+
+    def _query_page(self, last_id):
+        query = PAGE_QUERY.format(page_size=self.page_size, where=self.where)
+        return self.swis.query(query, last_id=last_id)['results']
+
+    async def hostnames(self):
+        """Yield every node's hostname, from the cache and/or Orion as pages arrive."""
+        cached = self._load_cache()
+        now = time.time()
+        if cached is not None and now - cached['refreshed_at'] < self.ttl:
+            for _, name in cached['nodes']:
+                yield name
+            return
+
+        full = cached is None or now - cached['full_at'] >= self.full_refresh
+        nodes = {} if full else {node_id: name for node_id, name in cached['nodes']}
+        full_at = now if full else cached['full_at']
+        if not full:
+            # Incremental refresh: everything cached is still queued, then only new nodes are fetched
+            for name in nodes.values():
+                yield name
+        last_id = max(nodes) if nodes else 0
+        try:
+            while True:
+                page = await asyncio.to_thread(self._query_page, last_id)
+                for row in page:
+                    nodes[row['NodeID']] = row['NodeName']
+                    yield row['NodeName']
+                if len(page) < self.page_size:
+                    break
+                last_id = page[-1]['NodeID']
+        except Exception as e:
+            if cached is None:
+                raise
+            print('WARNING: Orion query failed ({}), using cached node list'.format(e))
+            if full:
+                streamed = set(nodes)
+                for node_id, name in cached['nodes']:
+                    if node_id not in streamed:
+                        yield name
+            return
+        self._save_cache(nodes, full_at)
+
+    def hostname_list(self):
+        """All hostnames as a list, for callers that aren't async."""
+        async def collect():
+            return [name async for name in self.hostnames()]
+
+        return asyncio.run(collect())
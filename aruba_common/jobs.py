@@ -0,0 +1,111 @@
+"""Compose several controller operations into one SSH session per device.
+
+Writing memory, purging blacklist clients, pushing config and rebooting used
+to be separate scripts, each logging into every controller again.  compose()
+turns an ordered list of operations into a single run_sessions task, so a
+maintenance window pays the login cost once per controller.
+
+    task = compose(ConfigSet(), Command('stm purge-blacklist-clients'), WriteMem(), Reload())
+    run_sessions(read_devices(), task, username, password)
+
+Operations run in order and the first one that raises stops the rest for that
+device.  Each runs inside a metrics stage named after it.
+"""
+from aruba_common.metrics import stage
+
+RELOAD_PROMPT = 'Do you really want to restart the system(y/n):'
+
+
+class Command:
+    """Run one exec mode command with send_command.
+
+    Args:
+        command (str): Command to run, e.g. 'stm purge-blacklist-clients'.
+        name (str, optional): Stage and output name. Defaults to the command.
+    """
+
+    def __init__(self, command, name=None):
+        self.command = command
+        self.name = name or command
+
+    def run(self, ssh_session, item):
+        return ssh_session.send_command(self.command)
+
+
+class WriteMem(Command):
+    """Save the running config."""
+
+    def __init__(self):
+        super().__init__('write mem', name='write_mem')
+
+
+class ConfigSet:
+    """Send config lines with send_config_set.
+
+    Args:
+        lines (list, optional): Lines to send to every device. Defaults to the
+            queued item's payload, a list or an '=' separated string as in the
+            hostname,conf CSV files.
+        name (str, optional): Stage and output name. Defaults to 'config'.
+    """
+
+    def __init__(self, lines=None, name='config'):
+        self.lines = lines
+        self.name = name
+
+    def run(self, ssh_session, item):
+        lines = self.lines
+        if lines is None:
+            lines = item[1].split('=') if isinstance(item[1], str) else item[1]
+        lines = [line for line in lines if line.strip()]
+        if not lines:
+            return ''
+        return ssh_session.send_config_set(lines)
+
+
+class PromptedCommand:
+    """Run a command that asks for confirmation and answer it.
+
+    Args:
+        command (str): Command to run.
+        prompt (str): Text of the confirmation prompt.
+        answer (str, optional): Reply sent when the prompt shows up. Defaults to 'y'.
+        max_loops (int, optional): netmiko read loops for the reply. Defaults to 20.
+        name (str, optional): Stage and output name. Defaults to the command.
+    """
+
+    def __init__(self, command, prompt, answer='y', max_loops=20, name=None):
+        self.command = command
+        self.prompt = prompt
+        self.answer = answer
+        self.max_loops = max_loops
+        self.name = name or command
+
+    def run(self, ssh_session, item):
+        output = ssh_session.send_command_timing(self.command)
+        if self.prompt in output:
+            output += ssh_session.send_command_timing(self.answer, max_loops=self.max_loops)
+        return output
+
+
+class Reload(PromptedCommand):
+    """Reboot the controller, answering its y/n prompt.  Should be the last operation."""
+
+    def __init__(self):
+        super().__init__('reload', RELOAD_PROMPT, name='reload')
+
+
+def compose(*operations):
+    """Build a run_sessions task that runs operations in order over one session.
+
+    Returns:
+        callable: task(ssh_session, item) returning [[operation name, output], ...].
+    """
+    def task(ssh_session, item):
+        outputs = []
+        for operation in operations:
+            with stage(operation.name):
+                outputs.append([operation.name, operation.run(ssh_session, item)])
+        return outputs
+
+    return task
@@ -0,0 +1,88 @@
+"""Persistent per-device run journal for resuming partially failed fleet runs.
+
+Every finished device is appended to a JSON lines file as soon as its result
+is in, so the journal survives a crash or Ctrl-C.  A run started with
+``resume=True`` reads the journal back and the engine skips every work item
+whose latest entry is done, which leaves only failed and never attempted
+items in the queue.
+
+Entries are kept per work item, not per host: a host queued twice with
+different config (one CSV row per line) is only skipped once both items are
+done.
+"""
+import hashlib
+import json
+import os
+import time
+
+
+def default_journal_path(script_file):
+    """Journal file kept next to the script, e.g. csv_conf.journal.jsonl."""
+    return os.path.splitext(os.path.abspath(script_file))[0] + '.journal.jsonl'
+
+
+def item_id(item):
+    """Journal key of a work item: the hostname itself, or hostname#hash of the whole item."""
+    if isinstance(item, str):
+        return item
+    payload = json.dumps(item, sort_keys=True, default=repr).encode()
+    return '{}#{}'.format(item[0], hashlib.sha256(payload).hexdigest()[:16])
+
+
+def result_ok(result):
+    """Default done check, the task returned without raising."""
+    return result.ok
+
+
+class RunJournal:
+    """Append-only JSON lines journal of device outcomes.
+
+    Args:
+        path (str): Journal file.
+        resume (bool, optional): Keep the existing journal and skip devices it
+            lists as done. False starts a new journal. Defaults to False.
+        is_done (callable, optional): Decides from a DeviceResult whether the
+            device needs no further work. Defaults to result_ok.
+    """
+
+    def __init__(self, path, resume=False, is_done=result_ok):
+        self.path = path
+        self.resume = resume
+        self.is_done = is_done
+        self.done = {}
+        if resume and os.path.exists(path):
+            with open(path) as journal_file:
+                for line in journal_file:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # Last line of a run that was killed mid-write
+                        continue
+                    self.done[entry.get('item', entry['host'])] = entry['done']
+        self._file = open(path, 'a' if resume else 'w')
+
+    def succeeded(self, item):
+        """True when the journal's latest entry for the work item is done."""
+        return self.done.get(item_id(item), False)
+
+    def record(self, result):
+        """Append a DeviceResult to the journal and flush it to disk."""
+        done = bool(self.is_done(result))
+        self.done[item_id(result.item)] = done
+        entry = {'host': result.host,
+                 'item': item_id(result.item),
+                 'done': done,
+                 'error': None if result.error is None else repr(result.error),
+                 'elapsed': round(result.elapsed, 3),
+                 'time': time.time()}
+        self._file.write(json.dumps(entry) + '\n')
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,201 @@
+"""Per-device, per-stage timing for fleet runs with Prometheus and JSON export.
+
+The engine and run_sessions time the stages they own: ``queue_wait`` (queued
+until a worker picked the device up), ``tcp_connect``, ``ssh_login`` (SSH
+handshake, auth and netmiko's prompt/paging setup), ``command`` and
+``disconnect``.  Tasks mark finer stages with the stage() context manager,
+e.g. ``with stage('write_mem'):``; time spent in a nested stage is not
+counted again in the stage around it.  stage() does nothing outside a timed
+session, so tasks keep working when metrics are off.
+
+FleetMetrics aggregates every device into per-stage histograms and per-site
+summaries, and writes a Prometheus text file and a JSON report.
+"""
+import json
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+_local = threading.local()
+
+
+def site_from_hostname(host):
+    """Default site of a controller.
+
+    The hostname without its trailing number (arubalab1 -> arubalab), or the
+    /24 for controllers queued by IP address (10.1.2.3 -> 10.1.2.0/24).
+    """
+    if re.match(r'^\d+\.\d+\.\d+\.\d+$', host):
+        return host.rsplit('.', 1)[0] + '.0/24'
+    return re.sub(r'[-_]?\d+$', '', host) or host
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100.0 * (len(values) - 1))))]
+
+
+class StageTimer:
+    """Stage durations of one device, with nested stages excluded from their parent."""
+
+    def __init__(self, host):
+        self.host = host
+        self.stages = {}
+        self._stack = []
+
+    @contextmanager
+    def stage(self, name):
+        started = time.monotonic()
+        self._stack.append(0.0)
+        try:
+            yield
+        finally:
+            nested = self._stack.pop()
+            elapsed = time.monotonic() - started
+            self.stages[name] = self.stages.get(name, 0.0) + elapsed - nested
+            if self._stack:
+                self._stack[-1] += elapsed
+
+    def add(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+
+@contextmanager
+def timing(timer):
+    """Make timer the current thread's timer for stage() calls."""
+    previous = getattr(_local, 'timer', None)
+    _local.timer = timer
+    try:
+        yield timer
+    finally:
+        _local.timer = previous
+
+
+@contextmanager
+def stage(name):
+    """Time a block as stage name of the current device, if metrics are on."""
+    timer = getattr(_local, 'timer', None)
+    if timer is None:
+        yield
+    else:
+        with timer.stage(name):
+            yield
+
+
+class FleetMetrics:
+    """Collects StageTimers for a run and exports them.
+
+    Args:
+        site_of (callable, optional): Maps a hostname to its site. Defaults to site_from_hostname.
+        buckets (tuple, optional): Histogram bucket bounds in seconds. Defaults to BUCKETS.
+    """
+
+    def __init__(self, site_of=site_from_hostname, buckets=BUCKETS):
+        self.site_of = site_of
+        self.buckets = buckets
+        self.devices = {}
+        self.outcomes = {}
+        self._lock = threading.Lock()
+
+    def timer(self, host):
+        """Return the StageTimer for host, creating it on first use."""
+        with self._lock:
+            if host not in self.devices:
+                self.devices[host] = StageTimer(host)
+            return self.devices[host]
+
+    def record(self, result):
+        """Note a DeviceResult's outcome and total time."""
+        self.timer(result.host).add('total', result.elapsed)
+        with self._lock:
+            self.outcomes[result.host] = 'ok' if result.ok else type(result.error).__name__
+
+    def _samples(self):
+        """{(site, stage): [seconds, ...]} over every device."""
+        samples = {}
+        for host, timer in list(self.devices.items()):
+            site = self.site_of(host)
+            for name, seconds in timer.stages.items():
+                samples.setdefault((site, name), []).append(seconds)
+        return samples
+
+    def summary(self):
+        """Per-stage and per-site statistics as a dictionary."""
+        samples = self._samples()
+        stages = {}
+        for (site, name), values in samples.items():
+            stages.setdefault(name, []).extend(values)
+
+        def stats(values):
+            return {'count': len(values),
+                    'sum': round(sum(values), 3),
+                    'p50': round(percentile(values, 50), 3),
+                    'p90': round(percentile(values, 90), 3),
+                    'p99': round(percentile(values, 99), 3),
+                    'max': round(max(values), 3)}
+
+        sites = {}
+        for (site, name), values in samples.items():
+            sites.setdefault(site, {})[name] = stats(values)
+        outcomes = {}
+        for outcome in self.outcomes.values():
+            outcomes[outcome] = outcomes.get(outcome, 0) + 1
+        return {'outcomes': outcomes,
+                'stages': {name: stats(values) for name, values in stages.items()},
+                'sites': sites}
+
+    def write_json(self, path):
+        """Write the summary plus every device's stage times to path."""
+        report = self.summary()
+        report['devices'] = {host: {'site': self.site_of(host),
+                                    'outcome': self.outcomes.get(host),
+                                    'stages': {name: round(seconds, 3) for name, seconds in timer.stages.items()}}
+                             for host, timer in self.devices.items()}
+        with open(path, 'w') as report_file:
+            json.dump(report, report_file, indent=2)
+
+    def prometheus(self):
+        """Return the metrics in Prometheus text exposition format."""
+        samples = self._samples()
+        stages = {}
+        for (site, name), values in samples.items():
+            stages.setdefault(name, []).extend(values)
+        lines = ['# HELP aruba_stage_seconds Time each device spent in a stage.',
+                 '# TYPE aruba_stage_seconds histogram']
+        for name in sorted(stages):
+            values = stages[name]
+            for bound in self.buckets:
+                count = sum(1 for value in values if value <= bound)
+                lines.append('aruba_stage_seconds_bucket{{stage="{}",le="{}"}} {}'.format(name, bound, count))
+            lines.append('aruba_stage_seconds_bucket{{stage="{}",le="+Inf"}} {}'.format(name, len(values)))
+            lines.append('aruba_stage_seconds_sum{{stage="{}"}} {:.6f}'.format(name, sum(values)))
+            lines.append('aruba_stage_seconds_count{{stage="{}"}} {}'.format(name, len(values)))
+        lines += ['# HELP aruba_site_stage_seconds Per-site stage time quantiles.',
+                  '# TYPE aruba_site_stage_seconds summary']
+        for (site, name) in sorted(samples):
+            values = samples[(site, name)]
+            for quantile in (0.5, 0.99):
+                lines.append('aruba_site_stage_seconds{{site="{}",stage="{}",quantile="{}"}} {:.6f}'.format(
+                    site, name, quantile, percentile(values, quantile * 100)))
+            lines.append('aruba_site_stage_seconds_sum{{site="{}",stage="{}"}} {:.6f}'.format(site, name, sum(values)))
+            lines.append('aruba_site_stage_seconds_count{{site="{}",stage="{}"}} {}'.format(site, name, len(values)))
+        lines += ['# HELP aruba_devices_total Devices by outcome.',
+                  '# TYPE aruba_devices_total counter']
+        for outcome, count in sorted(self.summary()['outcomes'].items()):
+            lines.append('aruba_devices_total{{outcome="{}"}} {}'.format(outcome, count))
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path):
+        """Write the Prometheus text file, e.g. for node_exporter's textfile collector."""
+        with open(path, 'w') as prom_file:
+            prom_file.write(self.prometheus())
+
+    def write_reports(self, prefix):
+        """Write prefix.metrics.json and prefix.prom."""
+        self.write_json(prefix + '.metrics.json')
+        self.write_prometheus(prefix + '.prom')
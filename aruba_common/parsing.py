@@ -0,0 +1,83 @@
+"""Process pool stage for parsing large show command outputs.
+
+The engine's worker threads do the SSH I/O and, until now, also parsed what
+they read.  A regex pass over a 20k user ``show user`` table holds the GIL
+long enough to stall every other session's reads.  ParsePool sends big
+outputs to a ProcessPoolExecutor instead; the calling thread just waits on
+the result, which releases the GIL for the I/O threads.
+
+Outputs above ``shm_threshold`` are written once into a SharedMemory block
+and only its name is sent to the child, instead of pickling megabytes of text
+through the pool's pipe.  Small outputs are parsed in the calling thread,
+where a process round trip would cost more than the parse.
+
+Parsers must be module level functions so they can be pickled, e.g.
+aruba_common.subnets.line_ips.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+
+def _parse_text(parser, output):
+    return parser(output)
+
+
+def _parse_shared(parser, name, size):
+    block = shared_memory.SharedMemory(name=name)
+    try:
+        output = bytes(block.buf[:size]).decode('utf-8', errors='replace')
+    finally:
+        block.close()
+    return parser(output)
+
+
+class ParsePool:
+    """Parse show command outputs off the I/O threads.
+
+    Args:
+        max_workers (int, optional): Parser processes. Defaults to the CPU count.
+        min_size (int, optional): Outputs shorter than this many characters are
+            parsed in the calling thread. Defaults to 65536.
+        shm_threshold (int, optional): Outputs of at least this many bytes go
+            through shared memory. Defaults to 1048576.
+    """
+
+    def __init__(self, max_workers=None, min_size=64 * 1024, shm_threshold=1024 * 1024):
+        self.max_workers = max_workers
+        self.min_size = min_size
+        self.shm_threshold = shm_threshold
+        self._executor = None
+
+    def _pool(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._executor
+
+    def parse(self, parser, output):
+        """Return parser(output), run in a parser process when output is large.
+
+        Safe to call from the engine's worker threads.
+        """
+        if len(output) < self.min_size:
+            return parser(output)
+        data = output.encode('utf-8')
+        if len(data) < self.shm_threshold:
+            return self._pool().submit(_parse_text, parser, output).result()
+        block = shared_memory.SharedMemory(create=True, size=len(data))
+        try:
+            block.buf[:len(data)] = data
+            return self._pool().submit(_parse_shared, parser, block.name, len(data)).result()
+        finally:
+            block.close()
+            block.unlink()
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
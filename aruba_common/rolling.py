@@ -0,0 +1,198 @@
+"""Rolling reboots: reboot in slots per site and wait for each controller to come back.
+
+aruba_reboot.py used to send write mem and reload to up to 100 controllers at
+once and stop tracking them.  RollingReboot keeps a slot taken from the
+reload until the controller answers SSH again and its ready command shows the
+services are up, so at most ``wave_size`` controllers, and at most
+``site_cap`` per site, are down at any time.  Once ``max_failures``
+controllers fail to reload or to come back, no further controller is
+rebooted; the ones still queued fail with RolloutHalted and are picked up
+again by ``--resume``.
+
+The waiting is done with asyncio (TCP probes on the SSH port); only the
+reload and the readiness logins use netmiko, on a thread pool.
+"""
+import asyncio
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from aruba_common.engine import open_session, run_fleet_async
+from aruba_common.jobs import Reload, WriteMem, compose
+from aruba_common.metrics import site_from_hostname
+
+
+class RolloutHalted(Exception):
+    """Raised for queued controllers once too many reboots have failed."""
+
+
+class SiteCaps:
+    """Fixed limit on devices in flight overall and per site.
+
+    Has the try_acquire/release interface of AdaptiveLimiter so
+    run_fleet_async can use it as its limiter.
+
+    Args:
+        maximum (int): Devices in flight overall.
+        per_site (int): Devices in flight per site.
+        group_of (callable, optional): Maps a hostname to its site. Defaults to site_from_hostname.
+    """
+
+    def __init__(self, maximum, per_site, group_of=site_from_hostname):
+        self.maximum = maximum
+        self.per_site = per_site
+        self.group_of = group_of
+        self.in_flight = 0
+        self.sites = {}
+
+    def try_acquire(self, host):
+        site = self.group_of(host)
+        if self.sites.get(site, 0) >= self.per_site or self.in_flight >= self.maximum:
+            return False
+        self.sites[site] = self.sites.get(site, 0) + 1
+        self.in_flight += 1
+        return True
+
+    def release(self, result):
+        self.sites[self.group_of(result.host)] -= 1
+        self.in_flight -= 1
+
+
+async def port_open(host, port, timeout=5):
+    """True when a TCP connection to host:port succeeds within timeout."""
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    except (OSError, asyncio.TimeoutError):
+        return False
+    writer.close()
+    return True
+
+
+class RollingReboot:
+    """Reboot controllers a few at a time, waiting for each to come back.
+
+    Args:
+        username (str): Controller username.
+        password (str): Controller password.
+        wave_size (int, optional): Controllers rebooting at once. Defaults to 20.
+        site_cap (int, optional): Controllers rebooting at once per site. Defaults to 2.
+        group_of (callable, optional): Maps a hostname to its site. Defaults to site_from_hostname.
+        max_failures (int, optional): Failed reboots that halt the rollout. Defaults to 3.
+        down_timeout (float, optional): Seconds for SSH to go away after reload. Defaults to 180.
+        ready_timeout (float, optional): Seconds for the controller to be ready again
+            after it went down. Defaults to 1200.
+        poll_interval (float, optional): Seconds between readiness probes. Defaults to 15.
+        ready_command (str, optional): Command run once SSH is back. Defaults to 'show switchinfo'.
+        ready_pattern (str, optional): Regex its output must match for the
+            controller to count as ready. Defaults to 'Reboot Cause'.
+        session_options (dict, optional): Extra netmiko ConnectHandler arguments. Defaults to None.
+    """
+
+    def __init__(self, username, password, wave_size=20, site_cap=2, group_of=site_from_hostname,
+                 max_failures=3, down_timeout=180, ready_timeout=1200, poll_interval=15,
+                 ready_command='show switchinfo', ready_pattern='Reboot Cause', session_options=None):
+        self.username = username
+        self.password = password
+        self.wave_size = wave_size
+        self.site_cap = site_cap
+        self.group_of = group_of
+        self.max_failures = max_failures
+        self.down_timeout = down_timeout
+        self.ready_timeout = ready_timeout
+        self.poll_interval = poll_interval
+        self.ready_command = ready_command
+        self.ready_pattern = re.compile(ready_pattern)
+        self.session_options = session_options or {}
+        self.port = self.session_options.get('port', 22)
+        self.failures = []
+        self.halted = False
+        self._reboot = compose(WriteMem(), Reload())
+        self._executor = None
+        self._metrics = None
+
+    def _reload(self, host):
+        ssh_session = open_session(host, self.username, self.password, **self.session_options)
+        try:
+            return self._reboot(ssh_session, host)
+        finally:
+            try:
+                ssh_session.disconnect()
+            except Exception:
+                # The controller may already have dropped the session
+                pass
+
+    def _ready(self, host):
+        try:
+            ssh_session = open_session(host, self.username, self.password, **self.session_options)
+        except Exception:
+            return False
+        try:
+            return bool(self.ready_pattern.search(ssh_session.send_command(self.ready_command)))
+        except Exception:
+            return False
+        finally:
+            ssh_session.disconnect()
+
+    def _stage(self, host, name, started):
+        if self._metrics is not None:
+            self._metrics.timer(host).add(name, time.monotonic() - started)
+        return time.monotonic()
+
+    async def _wait_for(self, probe, timeout):
+        deadline = time.monotonic() + timeout
+        while True:
+            if await probe():
+                return True
+            if time.monotonic() >= deadline:
+                return False
+            await asyncio.sleep(self.poll_interval)
+
+    async def reboot(self, host):
+        """Reload host and wait until it is ready again.  The run_fleet_async task."""
+        if self.halted:
+            raise RolloutHalted('not rebooted, rollout halted after {} failures'.format(len(self.failures)))
+        loop = asyncio.get_running_loop()
+        try:
+            started = time.monotonic()
+            output = await loop.run_in_executor(self._executor, self._reload, host)
+            started = self._stage(host, 'reload', started)
+            if not await self._wait_for(lambda: self._port_closed(host), self.down_timeout):
+                raise RuntimeError('still answering SSH {}s after reload'.format(self.down_timeout))
+            started = self._stage(host, 'shutdown', started)
+            deadline = time.monotonic() + self.ready_timeout
+            if not await self._wait_for(lambda: port_open(host, self.port), self.ready_timeout):
+                raise RuntimeError('SSH not back after {}s'.format(self.ready_timeout))
+            started = self._stage(host, 'boot', started)
+
+            async def ready():
+                return await loop.run_in_executor(self._executor, self._ready, host)
+
+            if not await self._wait_for(ready, max(0.0, deadline - time.monotonic())):
+                raise RuntimeError('SSH is back but "{}" does not show it ready'.format(self.ready_command))
+            self._stage(host, 'services', started)
+            return output
+        except Exception:
+            self.failures.append(host)
+            if len(self.failures) >= self.max_failures and not self.halted:
+                self.halted = True
+                print('*** {} controllers failed to come back, halting the rollout ***'.format(
+                    len(self.failures)))
+            raise
+
+    async def _port_closed(self, host):
+        return not await port_open(host, self.port)
+
+    async def run_async(self, items, **kwargs):
+        """Reboot every host in items, see run_fleet_async for kwargs."""
+        self._metrics = kwargs.get('metrics')
+        self._executor = ThreadPoolExecutor(max_workers=self.wave_size)
+        try:
+            return await run_fleet_async(items, self.reboot,
+                                         limiter=SiteCaps(self.wave_size, self.site_cap, self.group_of),
+                                         **kwargs)
+        finally:
+            self._executor.shutdown(wait=False)
+
+    def run(self, items, **kwargs):
+        """Blocking wrapper around run_async for the scripts."""
+        return asyncio.run(self.run_async(items, **kwargs))
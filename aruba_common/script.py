@@ -0,0 +1,105 @@
+"""The setup every Aruba_Conf and aruba_operations script shares.
+
+credentials() asks for the controller login and tests it; run_script() runs a
+task over the work items with an AdaptiveLimiter, a RunJournal and
+FleetMetrics, through run_distributed so --coordinator and --worker work,
+and writes the metrics reports next to the script.  Both read the command
+line: --resume keeps the journal and skips devices it has as done.
+"""
+import os
+import socket
+import sys
+from getpass import getpass
+
+from aruba_common.concurrency import AdaptiveLimiter
+from aruba_common.distributed import fleet_role, run_distributed
+from aruba_common.engine import check_credentials
+from aruba_common.journal import RunJournal, default_journal_path, result_ok
+from aruba_common.metrics import FleetMetrics, site_from_hostname
+
+# How far above a script's max_threads the limiter may go while logins stay fast
+HEADROOM = 4
+
+
+def credentials(check=True, argv=None):
+    """Prompt for username and password and test them, exiting when the test login fails.
+
+    Args:
+        check (bool, optional): Test the login with check_credentials. Defaults to True.
+        argv (list, optional): Command line. Defaults to sys.argv.
+
+    Returns:
+        tuple: (username, password), (None, None) for a --coordinator, which
+            never logs in to a controller.
+    """
+    role, _ = fleet_role(argv)
+    if role == 'coordinator':
+        return None, None
+    # NOTE: input and getpass don't work in IDE
+    username = input('Username:')
+    password = getpass()
+    if check:
+        print('*** Testing SSH Creds ***')
+        if not check_credentials(username, password):
+            sys.exit(1)
+        print('*** SSH Creds Success! ***')
+    return username, password
+
+
+def run_script(script_file, items, task, username, password, max_threads=100, headroom=HEADROOM,
+               timeout=None, is_done=result_ok, run=None, argv=None, **kwargs):
+    """Run task over items with the journal, limiter and metrics of a fleet script.
+
+    Args:
+        script_file (str): The script's __file__, the journal and the metrics
+            reports (<script>.metrics.json and <script>.prom) are kept next to it.
+            A --worker opens no journal and writes its reports to
+            <script>.worker-<hostname>-<pid>.*.
+        items (iterable): Work items, see run_fleet_async.
+        task (callable): Function taking (netmiko session, item).
+        username (str): Controller username.
+        password (str): Controller password.
+        max_threads (int, optional): Sessions the script's fixed thread pool
+            used to run.  The AdaptiveLimiter, which backs off per site on
+            timeouts and auth failures, may go up to headroom times this. Defaults to 100.
+        headroom (int, optional): Ceiling of the limiter as a multiple of
+            max_threads, 1 makes max_threads a hard cap, e.g. for reloads. Defaults to HEADROOM.
+        timeout (float, optional): Per-device timeout in seconds. Defaults to None.
+        is_done (callable, optional): Decides from a DeviceResult whether a
+            device is done for --resume, see RunJournal. Defaults to result_ok.
+        run (callable, optional): Called as run(items, journal=..., metrics=...)
+            instead of run_distributed, e.g. RollingReboot.run.  Such a run is
+            local only, the script exits with an error when started with
+            --coordinator or --worker. Defaults to None.
+        argv (list, optional): Command line. Defaults to sys.argv.
+        **kwargs: Passed on to run_distributed.
+
+    Returns:
+        FleetReport: One DeviceResult per item.
+    """
+    argv = sys.argv if argv is None else argv
+    role, _ = fleet_role(argv)
+    if run is not None and role is not None:
+        # Every worker would run the whole item list itself
+        sys.exit('{}: this mode cannot be combined with --{}'.format(os.path.basename(script_file), role))
+    prefix = os.path.splitext(os.path.abspath(script_file))[0]
+    metrics = FleetMetrics()
+    journal = None
+    if role == 'worker':
+        # The coordinator keeps the journal and the run's reports, which may
+        # sit in this same checkout; a worker's own timings go to a file of its own
+        prefix += '.worker-{}-{}'.format(socket.gethostname(), os.getpid())
+    else:
+        journal = RunJournal(default_journal_path(script_file), resume='--resume' in argv, is_done=is_done)
+    try:
+        if run is not None:
+            report = run(items, journal=journal, metrics=metrics)
+        else:
+            limiter = AdaptiveLimiter(maximum=max_threads * headroom, group_of=site_from_hostname)
+            report = run_distributed(items, task, username, password, timeout=timeout, journal=journal,
+                                     metrics=metrics, limiter=limiter, argv=argv, **kwargs)
+    finally:
+        if journal is not None:
+            journal.close()
+    metrics.write_reports(prefix)
+    return report
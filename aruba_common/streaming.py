@@ -0,0 +1,80 @@
+"""Read a show command's output as it arrives and stop once the answer is known.
+
+send_command buffers the whole output before the caller can look at it.
+For a check like "is any user in this subnet" the first few lines usually
+decide it, yet a 20k user ``show user`` table still gets downloaded.
+stream_command hands each batch of complete lines to a predicate while the
+output is coming in.  As soon as the predicate returns True it sends Ctrl-C,
+which stops the output on the controller, and waits for the prompt so the
+session can be used again.
+
+Channel reads are usually a few KB.  The first batch is whatever the first
+reads brought, so an early match stops the output as soon as possible.  Each
+batch that doesn't match doubles the size the next one is collected to, up
+to ``max_batch``, e.g. ParsePool.min_size so a long output ends up parsed in
+a parser process.
+"""
+import re
+import time
+
+CTRL_C = '\x03'
+MORE_RE = re.compile(r'\s*--More--.*$')
+
+
+def stream_command(ssh_session, command, predicate, timeout=60, abort=CTRL_C, poll=0.01, max_batch=0):
+    """Run command and test its output batch by batch, stopping at the first match.
+
+    Args:
+        ssh_session: Open netmiko session.
+        command (str): Show command to run.
+        predicate (callable): Takes a block of complete output lines, returns True to stop.
+        timeout (float, optional): Seconds without reaching the prompt before
+            giving up. Defaults to 60.
+        abort (str, optional): Sent to cut the output short. Defaults to Ctrl-C.
+        poll (float, optional): Seconds between channel reads when nothing has arrived. Defaults to 0.01.
+        max_batch (int, optional): Most characters of complete lines collected
+            before calling predicate, 0 to call it on every read. Defaults to 0.
+
+    Returns:
+        bool: True when predicate matched, False when the output ended without a match.
+    """
+    prompt_re = re.compile(re.escape(ssh_session.base_prompt.strip()) + r'.*[#>]\s*$')
+    ssh_session.clear_buffer()
+    ssh_session.write_channel(ssh_session.normalize_cmd(command))
+    deadline = time.monotonic() + timeout
+    pending = ''
+    batch = ''
+    batch_size = 0
+    echoed = False
+    while True:
+        data = ssh_session.read_channel()
+        if not data:
+            if time.monotonic() > deadline:
+                raise TimeoutError('No prompt after "{}" within {}s'.format(command, timeout))
+            time.sleep(poll)
+            continue
+        pending += data
+        if MORE_RE.search(pending):
+            # Paging is on, ask for the next page
+            pending = MORE_RE.sub('', pending)
+            ssh_session.write_channel(' ')
+        end = pending.rfind('\n')
+        if end >= 0:
+            complete, pending = pending[:end + 1], pending[end + 1:]
+            if not echoed:
+                # The first line is the command echoed back
+                complete = complete.split('\n', 1)[1]
+                echoed = True
+            batch += complete
+        finished = prompt_re.search(pending) is not None
+        if batch and (finished or len(batch) >= batch_size):
+            matched = predicate(batch)
+            if matched:
+                break
+            batch_size = min(max_batch, 2 * len(batch))
+            batch = ''
+        if finished:
+            return False
+    ssh_session.write_channel(abort)
+    ssh_session.read_until_pattern(pattern=prompt_re.pattern, read_timeout=timeout)
+    return True
@@ -1,98 +1,74 @@
-import re
-from netaddr import IPNetwork, IPAddress
-from Queue import Queue
-from threading import Thread, RLock
-from getpass import getpass
-from netmiko import ConnectHandler
-from netmiko.ssh_exception import NetMikoTimeoutException
-from netmiko.ssh_exception import NetMikoAuthenticationException
+import os
+import sys
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from aruba_common.parsing import ParsePool
+from aruba_common.script import credentials, run_script
+from aruba_common.streaming import stream_command
+from aruba_common.subnets import SubnetIndex, line_ips
+
+# Sessions the old fixed thread pool ran, the limiter may go up to 4x this while logins stay fast
 max_threads = 30
-working_queue = Queue()
-print_lock = RLock()
-output_dict = {}
-username = raw_input('Username:')
-password = getpass()
-outlist = []
-error_list = []
-
-
-def ssh_session(thread_num, work_queue):
-    while True:
-        device_data = work_queue.get()
-        queued_device = device_data[0]
-        with print_lock:
-            print '{}: Working on "{}"'.format(thread_num, queued_device)
-        try:
-            router = {'device_type': 'aruba_os',
-                      'ip': queued_device,
-                      'username': username,
-                      'password': password,
-                      'verbose': False}
-            ssh_session = ConnectHandler(**router)
-            output = ssh_session.send_command("show user essid REDACTED | include 10.")
-            output1 = '1'
-            for line in output.splitlines():
-                ip = re.findall( r'[0-9]+(?:\.[0-9]+){3}', line)
-                if IPAddress(ip[0]) in IPNetwork(device_data[1] + "/23"):
-                    output1 = '0'
-                    break
-            ssh_session.disconnect()
-            if output1 == '0':
-                # Put output into a dictionary to reference later
-                output_dict[queued_device] = True
-            else:
-                output_dict[queued_device] = device_data[1]
-        except Exception, e:
-            error_list.append([queued_device, e])
-
-        work_queue.task_done()
+device_timeout = 300
+
 
+# Returns True when a user is in the site subnet, otherwise the subnet to retry
+def check_subnet(ssh_session, device_data):
+    # Stops the output as soon as one user is in the subnet. The first lines are
+    # checked as they come; on a long output the batches grow until they are big
+    # enough to be parsed in a separate process, so the SSH threads keep reading
+    if stream_command(ssh_session, "show user essid REDACTED | include 10.",
+                      lambda lines: site_index.contains(parse_pool.parse(line_ips, lines), device_data[0]),
+                      max_batch=parse_pool.min_size):
+        return True
+    return device_data[1]
 
 
 devices = [['arubalab1', '10.0.0.1'],
             ['arubalab2', '10.0.0.2']]
 
+# Each device's site /23, built once for every device
+site_index = SubnetIndex((device[0], device[1] + '/23') for device in devices)
 
-for thread_num in range(max_threads):
-    worker = Thread(target=ssh_session, args=(
-        thread_num, working_queue))
-    worker.setDaemon(True)
-    worker.start()
-
-for device in devices:
-    working_queue.put(device)
 
-working_queue.join()
+# Parser processes re-import this script on macOS, so only run it from the command line
+if __name__ == '__main__':
+    username, password = credentials(check=False)
+    parse_pool = ParsePool()
 
-site_good = []
-retry_list = []
+    with parse_pool:
+        # Only sites with a user in the subnet count as done, retry sites are checked again on --resume
+        report = run_script(__file__, devices, check_subnet, username, password,
+                            max_threads=max_threads, timeout=device_timeout,
+                            is_done=lambda result: result.ok and result.output == True)
 
-for device_name, output_info in output_dict.items():
-    if output_info == True:
-        sites_good.append([device_name, 'Vlan active'])
-    else:
-        retry_list.append([device_name, output_info])
+    sites_good = [[device_name, 'Vlan active (earlier run)'] for device_name in report.skipped]
+    retry_list = []
 
-print('\n\n\n*** Sites with at least 1 device in subnet ***')
-for item in sites_good:
-    print(item)
+    for result in report.succeeded:
+        if result.output == True:
+            sites_good.append([result.host, 'Vlan active'])
+        else:
+            retry_list.append([result.host, result.output])
 
-print('\n\n\n*** Sites to retry ***')
-for item in retry_list:
-    print(item)
+    print('\n\n\n*** Sites with at least 1 device in subnet ***')
+    for item in sites_good:
+        print(item)
 
-complete = len(sites_good)
-incomplete = len(retry_list)
-device_total = len(devices)
-complete_pct = 100 * float(complete)/float(device_total)
-incomplete_pct = 100 * float(incomplete)/float(device_total)
+    print('\n\n\n*** Sites to retry ***')
+    for item in retry_list:
+        print(item)
 
-print('\n\n*** Valid locations {0}/{1} = {2}%  ***\n\n\n'.format(complete, device_total, complete_pct))
+    complete = len(sites_good)
+    incomplete = len(retry_list)
+    device_total = len(devices)
+    complete_pct = 100 * float(complete)/float(device_total)
+    incomplete_pct = 100 * float(incomplete)/float(device_total)
 
-print('\n\n*** Invalid locations {0}/{1} = {2}%  ***\n\n\n'.format(incomplete, device_total, incomplete_pct))
+    print('\n\n*** Valid locations {0}/{1} = {2}%  ***\n\n\n'.format(complete, device_total, complete_pct))
 
-print '\n\n*** Errors Encountered ***'
-for i in error_list:
-    print '{}, {}'.format(i[0], i[1])
+    print('\n\n*** Invalid locations {0}/{1} = {2}%  ***\n\n\n'.format(incomplete, device_total, incomplete_pct))
 
+    print('\n\n*** Errors Encountered ***')
+    for result in report.failed:
+        print('{}, {}'.format(result.host, result.error))
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""Benchmark the fleet engine against simulated ArubaOS controllers.
+
+Starts benchmarks/mock_aruba_server.py in a child process (so its memory is
+not counted), then runs one of the fleet scripts' operations through
+aruba_common.engine.run_sessions for each requested fleet size and reports
+devices per second, p50/p99 per-device latency, failures and peak RSS.
+
+Example:
+    python3 benchmarks/bench_fleet.py --devices 100 1000 10000 --operation write_mem --latency 0.05
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import resource
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from aruba_common.concurrency import AdaptiveLimiter
+from aruba_common.distributed import Coordinator, run_distributed
+from aruba_common.engine import run_sessions
+from mock_aruba_server import serve
+
+
+# Same device work as the scripts in Aruba_Conf and aruba_operations
+def write_mem(ssh_session, queued_host):
+    ssh_session.send_command('write mem')
+
+
+def purge_blacklist(ssh_session, queued_host):
+    ssh_session.send_command('stm purge-blacklist-clients')
+
+
+def push_config(ssh_session, queued_host):
+    ssh_session.send_config_set(['ntp server 10.0.0.1', 'ip name-server 10.0.0.5'])
+    ssh_session.send_command('write mem')
+
+
+def show_user(ssh_session, queued_host):
+    return len(ssh_session.send_command('show user').splitlines())
+
+
+def reboot(ssh_session, queued_host):
+    ssh_session.send_command('write mem')
+    output = ssh_session.send_command_timing('reload')
+    if 'Do you really want to restart the system(y/n):' in output:
+        ssh_session.send_command_timing('y', max_loops=20)
+
+
+OPERATIONS = {'write_mem': write_mem,
+              'purge_blacklist': purge_blacklist,
+              'config': push_config,
+              'show_user': show_user,
+              'reboot': reboot}
+
+
+def device_hosts(count):
+    """count distinct loopback addresses, 250 per /24 starting at 127.0.0.1."""
+    return ['127.0.{}.{}'.format(num // 250, num % 250 + 1) for num in range(count)]
+
+
+def check_loopback(count, port):
+    """Exit with the lo0 alias setup when the last device address doesn't answer.
+
+    Linux routes all of 127.0.0.0/8 to lo; macOS only has 127.0.0.1 until
+    more addresses are aliased on lo0, see benchmarks/README.md.
+    """
+    host = device_hosts(count)[-1]
+    try:
+        socket.create_connection((host, port), timeout=2).close()
+    except OSError as e:
+        sys.exit('Cannot reach simulated controller {}:{} ({}). On macOS alias the addresses first:\n'
+                 '  for net in $(seq 0 {}); do for host in $(seq 1 250); do '
+                 'sudo ifconfig lo0 alias 127.0.$net.$host up; done; done'.format(host, port, e, (count - 1) // 250))
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100.0 * (len(values) - 1))))]
+
+
+def wait_for_port(port, deadline=10):
+    end = time.time() + deadline
+    while time.time() < end:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError('Mock server did not start on port {}'.format(port))
+
+
+def peak_rss_mb():
+    # ru_maxrss is KB on Linux and bytes on macOS
+    scale = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+
+def run_worker(address, operation, port, concurrency, timeout, adaptive):
+    limiter = AdaptiveLimiter(maximum=concurrency) if adaptive else None
+    run_distributed([], OPERATIONS[operation], 'bench', 'bench', argv=['--worker', address],
+                    max_concurrency=concurrency, timeout=timeout, verbose=False,
+                    session_options={'port': port}, limiter=limiter)
+
+
+def run_benchmark(count, operation, port, concurrency, timeout, adaptive=False, workers=0,
+                  coordinator_port=8765):
+    if workers:
+        # Coordinator here, each worker process with its own concurrency
+        address = '127.0.0.1:{}'.format(coordinator_port)
+        processes = [multiprocessing.Process(target=run_worker, daemon=True, args=(
+            address, operation, port, concurrency, timeout, adaptive)) for _ in range(workers)]
+        for process in processes:
+            process.start()
+        report = asyncio.run(Coordinator(device_hosts(count), address, verbose=False).serve())
+        for process in processes:
+            process.join()
+    else:
+        limiter = AdaptiveLimiter(maximum=concurrency) if adaptive else None
+        report = run_sessions(device_hosts(count), OPERATIONS[operation], 'bench', 'bench',
+                              max_concurrency=concurrency, timeout=timeout, verbose=False,
+                              session_options={'port': port}, limiter=limiter)
+    latencies = [result.elapsed for result in report.succeeded]
+    return {'devices': count,
+            'seconds': round(report.elapsed, 2),
+            'devices_per_sec': round(count / report.elapsed, 1) if report.elapsed else 0.0,
+            'p50': round(percentile(latencies, 50), 3),
+            'p99': round(percentile(latencies, 99), 3),
+            'failed': len(report.failed),
+            'peak_rss_mb': round(peak_rss_mb(), 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--devices', type=int, nargs='+', default=[100, 1000, 10000])
+    parser.add_argument('--operation', choices=sorted(OPERATIONS), default='write_mem')
+    parser.add_argument('--concurrency', type=int, default=100)
+    parser.add_argument('--adaptive', action='store_true', help='Use the AIMD limiter with --concurrency as ceiling')
+    parser.add_argument('--workers', type=int, default=0,
+                        help='Run through a coordinator and this many worker processes, --concurrency each')
+    parser.add_argument('--timeout', type=float, default=60)
+    parser.add_argument('--port', type=int, default=8022)
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to every mock response')
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--auth-fail-rate', type=float, default=0.0)
+    parser.add_argument('--hang-rate', type=float, default=0.0)
+    parser.add_argument('--user-count', type=int, default=50)
+    args = parser.parse_args()
+
+    # Leave room for the SSH sockets of every session in flight
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+    server = multiprocessing.Process(target=serve, daemon=True, kwargs={
+        'port': args.port, 'latency': args.latency, 'jitter': args.jitter,
+        'auth_fail_rate': args.auth_fail_rate, 'hang_rate': args.hang_rate,
+        'user_count': args.user_count})
+    server.start()
+    try:
+        wait_for_port(args.port)
+        check_loopback(max(args.devices), args.port)
+        print('{:>8} {:>9} {:>11} {:>8} {:>8} {:>7} {:>12}'.format(
+            'devices', 'seconds', 'devices/s', 'p50', 'p99', 'failed', 'peak RSS MB'))
+        for count in args.devices:
+            stats = run_benchmark(count, args.operation, args.port, args.concurrency,
+                                  args.timeout, args.adaptive, args.workers)
+            print('{devices:>8} {seconds:>9} {devices_per_sec:>11} {p50:>8} {p99:>8} '
+                  '{failed:>7} {peak_rss_mb:>12}'.format(**stats))
+    finally:
+        server.terminate()
+
+
+if __name__ == '__main__':
+    main()
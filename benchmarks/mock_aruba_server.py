@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""Stand-in ArubaOS controller SSH server for benchmarking the fleet scripts.
+
+One asyncssh server listens on every loopback address, so each of 127.0.0.1,
+127.0.0.2, ... 127.0.39.250 looks like a separate controller to netmiko.  The
+prompt is built from the address that was dialled.
+
+Emulated commands: no paging, configure terminal / end / exit, write mem,
+reload (with its y/n prompt), stm purge-blacklist-clients, show user and
+show running-config.  Long outputs are written in chunks and Ctrl-C stops
+them like it does on a controller.  Anything typed in config mode is accepted and kept in
+that session's running-config.
+
+Run on its own:
+    python3 benchmarks/mock_aruba_server.py --port 8022 --latency 0.05
+"""
+import argparse
+import asyncio
+import random
+
+import asyncssh
+
+RELOAD_PROMPT = 'Do you really want to restart the system(y/n):'
+BASE_CONFIG = ['version 6.5', 'hostname "{name}"', '!', 'ip name-server 10.0.0.5', '!']
+
+
+class MockAruba:
+    """Settings shared by every emulated controller.
+
+    Args:
+        username (str): Accepted username.
+        password (str): Accepted password.
+        latency (float): Seconds added before every command response.
+        jitter (float): Random extra latency, 0 to jitter seconds.
+        auth_fail_rate (float): Share of logins rejected, 0 to 1.
+        hang_rate (float): Share of sessions that stop answering after login, 0 to 1.
+        user_count (int): Rows returned by show user.
+        chunk_rows (int): Output rows written per chunk; Ctrl-C stops the output between chunks.
+        chunk_delay (float): Seconds between two chunks of output, to emulate a slow link.
+    """
+
+    def __init__(self, username='bench', password='bench', latency=0.0, jitter=0.0,
+                 auth_fail_rate=0.0, hang_rate=0.0, user_count=50, chunk_rows=200,
+                 chunk_delay=0.0):
+        self.username = username
+        self.password = password
+        self.latency = latency
+        self.jitter = jitter
+        self.auth_fail_rate = auth_fail_rate
+        self.hang_rate = hang_rate
+        self.user_count = user_count
+        self.chunk_rows = chunk_rows
+        self.chunk_delay = chunk_delay
+
+    async def delay(self):
+        pause = self.latency + random.uniform(0, self.jitter)
+        if pause:
+            await asyncio.sleep(pause)
+
+    def show_user(self):
+        rows = ['Users', '-----', 'IP            MAC                Name    Role      Age(d:h:m)  Auth']
+        for num in range(self.user_count):
+            rows.append('10.{}.{}.{}  00:1a:1e:{:02x}:{:02x}:{:02x}  user{}  employee  00:00:01  802.1x'.format(
+                (num >> 16) & 255, (num >> 8) & 255, num & 255,
+                (num >> 16) & 255, (num >> 8) & 255, num & 255, num))
+        rows.append('')
+        rows.append('User Entries: {}/{}'.format(self.user_count, self.user_count))
+        return '\n'.join(rows)
+
+    def server_factory(self):
+        mock = self
+
+        class Server(asyncssh.SSHServer):
+            def begin_auth(self, username):
+                return True
+
+            def password_auth_supported(self):
+                return True
+
+            def validate_password(self, username, password):
+                if random.random() < mock.auth_fail_rate:
+                    return False
+                return username == mock.username and password == mock.password
+
+        return Server
+
+    async def handle_session(self, process):
+        name = 'mock-{}'.format(process.get_extra_info('sockname')[0])
+        running = [line.format(name=name) for line in BASE_CONFIG]
+        config_mode = False
+        hang = random.random() < self.hang_rate
+
+        def prompt():
+            return '({}) {}#'.format(name, '(config) ' if config_mode else '')
+
+        interrupted = asyncio.Event()
+
+        async def lines():
+            # Echo and answer one line at a time like a real CLI does, even
+            # when netmiko sends several returns in one burst
+            buffer = ''
+            while True:
+                data = await process.stdin.read(4096)
+                if not data:
+                    return
+                if '\x03' in data:
+                    interrupted.set()
+                    data = data.replace('\x03', '')
+                buffer += data.replace('\r\n', '\r').replace('\n', '\r')
+                while '\r' in buffer:
+                    line, buffer = buffer.split('\r', 1)
+                    yield line
+
+        # Read input in the background so Ctrl-C can cut a long output short
+        queued = asyncio.Queue()
+
+        async def read_input():
+            try:
+                async for line in lines():
+                    await queued.put(line)
+            except (ConnectionError, asyncssh.Error):
+                # The client dropped the connection, the session ends below
+                pass
+            finally:
+                queued.put_nowait(None)
+
+        async def next_line():
+            line = await queued.get()
+            if line is None:
+                raise StopAsyncIteration
+            return line
+
+        async def write_output(output):
+            interrupted.clear()
+            rows = output.split('\n')
+            for start in range(0, len(rows), self.chunk_rows):
+                if interrupted.is_set():
+                    process.stdout.write('^C\r\n')
+                    return
+                process.stdout.write('\r\n'.join(rows[start:start + self.chunk_rows]) + '\r\n')
+                await process.stdout.drain()
+                if self.chunk_delay:
+                    await asyncio.sleep(self.chunk_delay)
+                else:
+                    await asyncio.sleep(0)
+
+        process.stdout.write(prompt())
+        reader = asyncio.ensure_future(read_input())
+        try:
+            while True:
+                line = await next_line()
+                if hang:
+                    continue
+                process.stdout.write(line + '\r\n')
+                command = line.strip()
+                await self.delay()
+                output = ''
+                if command in ('configure term', 'configure terminal'):
+                    config_mode = True
+                elif command in ('end', 'exit'):
+                    config_mode = False
+                elif command == 'write mem':
+                    output = 'Saving Configuration...\n\nConfiguration Saved.'
+                elif command == 'reload':
+                    process.stdout.write(RELOAD_PROMPT)
+                    answer = await next_line()
+                    process.stdout.write(answer + '\r\n')
+                    if answer.strip().lower() == 'y':
+                        process.stdout.write('System will now restart!\r\n')
+                        break
+                elif command.startswith('show user'):
+                    output = self.show_user()
+                elif command.startswith('show running-config'):
+                    output = '\n'.join(running)
+                elif config_mode and command:
+                    running.append(command)
+                if output:
+                    await write_output(output)
+                process.stdout.write(prompt())
+        except (asyncssh.BreakReceived, asyncssh.TerminalSizeChanged, ConnectionError, StopAsyncIteration):
+            pass
+        reader.cancel()
+        process.exit(0)
+
+    async def start(self, host='', port=8022):
+        """Start listening and return the asyncssh server object."""
+        key = asyncssh.generate_private_key('ssh-ed25519')
+        return await asyncssh.create_server(self.server_factory(), host, port,
+                                            server_host_keys=[key],
+                                            process_factory=self.handle_session,
+                                            line_editor=False,
+                                            backlog=4096)
+
+
+def serve(port=8022, **settings):
+    """Run a MockAruba server on port until the process is stopped."""
+    async def run():
+        await MockAruba(**settings).start(port=port)
+        await asyncio.Event().wait()
+
+    asyncio.run(run())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=8022)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--auth-fail-rate', type=float, default=0.0)
+    parser.add_argument('--hang-rate', type=float, default=0.0)
+    parser.add_argument('--user-count', type=int, default=50)
+    parser.add_argument('--chunk-delay', type=float, default=0.0)
+    args = parser.parse_args()
+    serve(port=args.port, latency=args.latency, jitter=args.jitter,
+          auth_fail_rate=args.auth_fail_rate, hang_rate=args.hang_rate,
+          user_count=args.user_count, chunk_delay=args.chunk_delay)
+
+
+if __name__ == '__main__':
+    main()
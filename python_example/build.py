@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+import hashlib
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from rendering import HOST_TEMPLATES, get_renderer
+
+
+def _render_host(args):
+    host, host_vars, templates_path = args
+    return host, get_renderer(templates_path).render_host(host_vars)
+
+
+def config_hash(configs):
+    """Content hash of one host's rendered configs, independent of dict order."""
+    digest = hashlib.sha256()
+    for name in sorted(configs):
+        digest.update(name.encode() + b'\0' + configs[name].encode() + b'\0')
+    return digest.hexdigest()
+
+
+def _write_json(path, data):
+    temp_file = f'{path}.{os.getpid()}.tmp'
+    with open(temp_file, 'w') as output:
+        json.dump(data, output, indent=2, sort_keys=True)
+    os.replace(temp_file, path)
+
+
+class Build:
+    """Rendered configs of every host, stored as content-hashed artifacts.
+
+    Each host's configs are written to {artifact_dir}/artifacts/{hash}/{config name}.cfg,
+    so hosts with identical configs share one artifact and an unchanged host
+    keeps its hash between runs. {artifact_dir}/manifest.json maps each host
+    to its hash.
+
+    Args:
+        artifact_dir (str, optional): Output directory. Defaults to './build'.
+    """
+
+    def __init__(self, artifact_dir='./build'):
+        self.artifact_dir = artifact_dir
+        self.hashes = {}
+
+    def _artifact_path(self, artifact_hash, name):
+        return os.path.join(self.artifact_dir, 'artifacts', artifact_hash, f'{name}.cfg')
+
+    def build(self, inventory, templates_path='./templates', max_workers=None, min_pool_hosts=64):
+        """Render every host's configs and write the artifacts and manifest.
+
+        Args:
+            inventory (Mapping): Host vars keyed by hostname.
+            templates_path (str, optional): Path to directory with j2 templates. Defaults to './templates'.
+            max_workers (int, optional): Render processes. Defaults to the CPU count.
+            min_pool_hosts (int, optional): Smaller inventories are rendered in this
+                process, where starting a pool costs more than it saves. Defaults to 64.
+
+        Returns:
+            dict: Artifact hash keyed by hostname.
+        """
+        os.makedirs(self.artifact_dir, exist_ok=True)
+        jobs = [(host, inventory[host], templates_path) for host in inventory]
+        logging.info(f'Building {len(HOST_TEMPLATES)} configs for {len(jobs)} hosts')
+        if len(jobs) < min_pool_hosts:
+            self._store(map(_render_host, jobs))
+        else:
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                self._store(executor.map(_render_host, jobs, chunksize=max(1, len(jobs) // 64)))
+        _write_json(os.path.join(self.artifact_dir, 'manifest.json'), self.hashes)
+        return self.hashes
+
+    def _store(self, rendered):
+        for host, configs in rendered:
+            artifact_hash = config_hash(configs)
+            self.hashes[host] = artifact_hash
+            for name, config in configs.items():
+                path = self._artifact_path(artifact_hash, name)
+                if not os.path.exists(path):
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    # Written aside and renamed, an artifact that exists is always complete
+                    temp_file = f'{path}.{os.getpid()}.tmp'
+                    with open(temp_file, 'w') as artifact:
+                        artifact.write(config)
+                    os.replace(temp_file, path)
+
+    def configs(self, host):
+        """Read one host's configs back from its artifact.
+
+        Returns:
+            dict: Rendered config keyed by config name.
+        """
+        configs = {}
+        for name in HOST_TEMPLATES:
+            with open(self._artifact_path(self.hashes[host], name)) as artifact:
+                configs[name] = artifact.read()
+        return configs
+
+
+class DeployedState:
+    """Last artifact hash successfully pushed to each host, kept in {artifact_dir}/deployed.json.
+
+    Args:
+        artifact_dir (str, optional): Directory holding deployed.json. Defaults to './build'.
+    """
+
+    def __init__(self, artifact_dir='./build'):
+        self.path = os.path.join(artifact_dir, 'deployed.json')
+        self._lock = threading.Lock()
+        self.hashes = {}
+        if os.path.exists(self.path):
+            with open(self.path) as state:
+                self.hashes = json.load(state)
+
+    def changed(self, host, artifact_hash):
+        """True when host has never been deployed or last got a different artifact."""
+        return self.hashes.get(host) != artifact_hash
+
+    def record(self, hashes):
+        """Mark hosts as deployed, hashes being {hostname: artifact hash}."""
+        with self._lock:
+            self.hashes.update(hashes)
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            _write_json(self.path, self.hashes)
+
+
+def main():
+    """Build the artifacts without touching any device."""
+    from inventory import load_inventory
+    logging.basicConfig(level=logging.INFO)
+    hashes = Build().build(load_inventory('./input/config.yaml'))
+    deployed = DeployedState()
+    changed = [host for host, artifact_hash in hashes.items() if deployed.changed(host, artifact_hash)]
+    logging.info(f'{len(changed)} of {len(hashes)} hosts changed since their last deploy: {", ".join(changed)}')
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,29 @@
 #!/usr/bin/env python3
 import logging
 import sys
+import threading
 import yaml
-from jinja2 import Environment, FileSystemLoader
-from napalm import get_network_driver
 from netaddr import IPNetwork, IPAddress
+from build import Build, DeployedState
+from convergence import expected_peers, wait_for_convergence
+from inventory import load_inventory
+from rendering import get_renderer
+from scheduler import Phase, PhaseFailed, run_phases
+from sessions import SessionManager
+from topology import preflight
+from validation import ValidationSuite
+
+# One connection per host, reused by every phase of main()
+sessions = SessionManager()
+# templates/validation/*.yaml, parsed once for every host and phase
+validation = ValidationSuite()
+print_lock = threading.Lock()
+# Seconds to wait for every BGP peer to come up after the BGP commit
+bgp_timeout = 300
+# Hosts configured and validated at once
+max_workers = 50
+# Run with --force to push to every host, not just those whose config changed since the last deploy
+force = '--force' in sys.argv
 
 
 def menu(title):
@@ -20,20 +39,19 @@ def menu(title):
 
 
 def extractYAML(yaml_file):
-    """This function extracts YAML vars from a YAML file.
+    """This function extracts YAML vars from a YAML file, or a directory with one YAML file per host.
 
     Args:
-        yaml_file (string): String containing the path to YAML file.
+        yaml_file (string): String containing the path to YAML file or directory.
 
     Returns:
         dictionary: Returns a dictionary with all values parsed from YAML file.
     """
     try:
-        with open(yaml_file) as var_file:
-            yaml_output = yaml.load(var_file, Loader=yaml.FullLoader)
-        return (yaml_output)
-    except:
-        print('Extracting YAML encountered an error')
+        return load_inventory(yaml_file)
+    except (OSError, yaml.YAMLError) as e:
+        logging.error(f'Extracting YAML from {yaml_file} encountered an error: {e}')
+        raise
 
 
 def renderJinja2(template, vars_to_render=None, templates_path='./templates'):
@@ -47,12 +65,8 @@ def renderJinja2(template, vars_to_render=None, templates_path='./templates'):
     Returns:
         string: String rendered from j2 template.
     """
-    file_loader = FileSystemLoader(templates_path)
-    env = Environment(loader=file_loader)
-    template = env.get_template(template)
-    config = vars_to_render
     logging.info('Returning rendered config')
-    return template.render(config)
+    return get_renderer(templates_path).render(template, vars_to_render)
 
 
 def configDevice(device_hostname, device_config, commit=False):
@@ -63,25 +77,21 @@ def configDevice(device_hostname, device_config, commit=False):
         device_config (str): Configuration to be deployed to the device.
         commit (bool, optional): Boolean to commit config, False will not commit. Defaults to False.
     """
-    logging.info('Set NAPALM driver to ios')
-    driver = get_network_driver("ios")
-    logging.info(f'Connecting to host {device_hostname}')
-    # I have hardcoded the user/pass, other options would be collecting creds from a secured source/vault or collecting from user on script run
-    device = driver(
-                hostname = device_hostname,
-                username = 'cisco',
-                password = 'cisco123'
-                )
-    device.open()
+    logging.info(f'Get cached connection to host {device_hostname}')
+    device = sessions.get(device_hostname)
     logging.info(f'Loading config to {device_hostname}')
     device.load_merge_candidate(config=device_config)
-    menu(f'{device_hostname} Diff')
-    print(device.compare_config())
+    diff = device.compare_config()
+    # Hosts are configured concurrently, keep each diff in one piece
+    with print_lock:
+        menu(f'{device_hostname} Diff')
+        print(diff)
     if commit:
         logging.info(f'Committing config to {device_hostname}')
         device.commit_config()
-    logging.info(f'Close connection with {device_hostname}')
-    device.close()
+    else:
+        logging.info(f'Discarding config on {device_hostname}')
+        device.discard_config()
 
 
 def validateLLDP(device_hostname):
@@ -93,19 +103,10 @@ def validateLLDP(device_hostname):
     Returns:
         bool: Returns a bool True for validation pass, False for validation fail
     """
-    logging.info('Set NAPALM driver to ios')
-    driver = get_network_driver("ios")
-    logging.info(f'Connecting to host {device_hostname}')
-    # I have hardcoded the user/pass, other options would be collecting creds from a secured source/vault or collecting from user on script run
-    device = driver(
-                hostname = device_hostname,
-                username = 'cisco',
-                password = 'cisco123'
-                )
-    device.open()
+    logging.info(f'Get cached connection to host {device_hostname}')
+    device = sessions.get(device_hostname)
     logging.info('Get compliance report for interfaces LLDP')
-    compliance = device.compliance_report(f'templates/validation/{device_hostname}_interfaces.yaml')
-    device.close()
+    compliance = validation.validate_host(device, device_hostname, specs=['interfaces'])['interfaces']
     logging.info(f'Verify interface compliance for {device_hostname}')
     if compliance['get_lldp_neighbors']['complies']:
         logging.info(f'{device_hostname} interfaces in compliance')
@@ -124,19 +125,10 @@ def validateBGP(device_hostname):
     Returns:
         bool: Returns a bool True for validation pass, False for validation fail
     """
-    logging.info('Set NAPALM driver to ios')
-    driver = get_network_driver("ios")
-    logging.info(f'Connecting to host {device_hostname}')
-    # I have hardcoded the user/pass, other options would be collecting creds from a secured source/vault or collecting from user on script run
-    device = driver(
-                hostname = device_hostname,
-                username = 'cisco',
-                password = 'cisco123'
-                )
-    device.open()
+    logging.info(f'Get cached connection to host {device_hostname}')
+    device = sessions.get(device_hostname)
     logging.info('Get compliance report for interfaces BGP')
-    compliance = device.compliance_report(f'templates/validation/{device_hostname}_bgp.yaml')
-    device.close()
+    compliance = validation.validate_host(device, device_hostname, specs=['bgp'])['bgp']
     logging.info(f'Verify bgp compliance for {device_hostname}')
     if compliance['get_bgp_neighbors']['complies']:
         logging.info(f'{device_hostname} bgp in compliance')
@@ -151,38 +143,56 @@ def main():
     """
     logging.basicConfig(level=logging.INFO)
     data = extractYAML('./input/config.yaml')
-
-    menu('Configure Interfaces')
-    for host in data:
-        logging.info(f'Render interface config from YAML vars for {host}')
-        interface_config = renderJinja2('interfaces.j2', data[host])
+    # Addressing and BGP mistakes show up here instead of after minutes of configuration
+    problems = preflight(data)
+    if problems:
+        for problem in problems:
+            logging.error(f'config.yaml: {problem}')
+        sys.exit(1)
+
+    logging.info('Build interface and BGP config from YAML vars for all hosts')
+    build = Build()
+    hashes = build.build(data)
+    deployed = DeployedState()
+    hosts = [host for host in data if force or deployed.changed(host, hashes[host])]
+    if not hosts:
+        logging.info('No host config changed since the last deploy, nothing to push')
+        return
+    logging.info(f'Pushing to {len(hosts)} of {len(hashes)} hosts: {", ".join(hosts)}')
+    configs = {host: build.configs(host) for host in hosts}
+
+    def configureInterfaces(host):
         logging.info(f'Configure interfaces on {host}')
-        configDevice(host, interface_config, commit=True)
-
-    menu('Validate Interfaces')
-    for host in data:
-        if validateLLDP(host):
-            logging.info(f'{host} interface validation passed')
-        else:
-            logging.warning(f'{host} failed interface validation, halting run')
-            sys.exit()
-
+        configDevice(host, configs[host]['interfaces'], commit=True)
 
-    menu('Configure BGP')
-    for host in data:
-        logging.info(f'Render BGP config from YAML vars for {host}')
-        bgp_config = renderJinja2('bgp.j2', data[host]['bgp'])
+    def configureBGP(host):
         logging.info(f'Configure BGP on {host}')
-        configDevice(host, bgp_config, commit=True)
-
-
-    menu('Validate BGP')
-    for host in data:
-        if validateBGP(host):
-            logging.info(f'{host} bgp validation passed')
-        else:
-            logging.warning(f'{host} failed bgp validation, halting run')
-            sys.exit()
+        configDevice(host, configs[host]['bgp'], commit=True)
+
+    # Each phase runs across all hosts at once, the next phase waits for every host
+    phases = [
+        Phase('Configure Interfaces', configureInterfaces),
+        Phase('Validate Interfaces', validateLLDP),
+        Phase('Configure BGP', configureBGP),
+    ]
+    bgp_phases = [
+        Phase('Validate BGP', validateBGP),
+    ]
+    try:
+        run_phases(phases, hosts, max_workers=max_workers, announce=menu)
+        # Validate as soon as every peer is up instead of after a fixed sleep
+        menu('Wait for BGP')
+        expected = expected_peers({host: data[host] for host in hosts})
+        convergence = wait_for_convergence(sessions.get, expected, timeout=bgp_timeout)
+        for host, peers in convergence.items():
+            for peer, seconds in peers.items():
+                print(f'{host} {peer}: ' + (f'Up after {seconds:.1f}s' if seconds is not None else 'not Up'))
+        run_phases(bgp_phases, hosts, max_workers=max_workers, announce=menu)
+        deployed.record({host: hashes[host] for host in hosts})
+    except PhaseFailed as e:
+        logging.warning(f'{e}, halting run')
+        sys.exit(1)
 
 if __name__ == "__main__":
-    main()
+    with sessions:
+        main()
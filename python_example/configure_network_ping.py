@@ -1,10 +1,27 @@
 #!/usr/bin/env python3
 import logging
 import sys
+import threading
 import yaml
-from jinja2 import Environment, FileSystemLoader
-from napalm import get_network_driver
-from netaddr import IPNetwork, IPAddress
+from build import Build, DeployedState
+from convergence import expected_peers, is_converged, wait_for_convergence
+from inventory import load_inventory
+from rendering import get_renderer
+from scheduler import Phase, PhaseFailed, run_phases
+from sessions import SessionManager
+from topology import ping_plan, preflight
+
+# One connection per host, reused by every phase of main()
+sessions = SessionManager()
+print_lock = threading.Lock()
+# get_interfaces_ip per host, fetched once per run
+interface_ips = {}
+# Seconds to wait for every BGP peer to come up after the BGP commit
+bgp_timeout = 300
+# Hosts configured and validated at once
+max_workers = 50
+# Run with --force to push to every host, not just those whose config changed since the last deploy
+force = '--force' in sys.argv
 
 
 def menu(title):
@@ -20,20 +37,19 @@ def menu(title):
 
 
 def extractYAML(yaml_file):
-    """This function extracts YAML vars from a YAML file.
+    """This function extracts YAML vars from a YAML file, or a directory with one YAML file per host.
 
     Args:
-        yaml_file (string): String containing the path to YAML file.
+        yaml_file (string): String containing the path to YAML file or directory.
 
     Returns:
         dictionary: Returns a dictionary with all values parsed from YAML file.
     """
     try:
-        with open(yaml_file) as var_file:
-            yaml_output = yaml.load(var_file, Loader=yaml.FullLoader)
-        return (yaml_output)
-    except:
-        print('Extracting YAML encountered an error')
+        return load_inventory(yaml_file)
+    except (OSError, yaml.YAMLError) as e:
+        logging.error(f'Extracting YAML from {yaml_file} encountered an error: {e}')
+        raise
 
 
 def renderJinja2(template, vars_to_render=None, templates_path='./templates'):
@@ -47,12 +63,8 @@ def renderJinja2(template, vars_to_render=None, templates_path='./templates'):
     Returns:
         string: String rendered from j2 template.
     """
-    file_loader = FileSystemLoader(templates_path)
-    env = Environment(loader=file_loader)
-    template = env.get_template(template)
-    config = vars_to_render
     logging.info('Returning rendered config')
-    return template.render(config)
+    return get_renderer(templates_path).render(template, vars_to_render)
 
 
 def configDevice(device_hostname, device_config, commit=False):
@@ -63,65 +75,67 @@ def configDevice(device_hostname, device_config, commit=False):
         device_config (str): Configuration to be deployed to the device.
         commit (bool, optional): Boolean to commit config, False will not commit. Defaults to False.
     """
-    logging.info('Set NAPALM driver to ios')
-    driver = get_network_driver("ios")
-    logging.info(f'Connecting to host {device_hostname}')
-    # I have hardcoded the user/pass, other options would be collecting creds from a secured source/vault or collecting from user on script run
-    device = driver(
-                hostname = device_hostname,
-                username = 'cisco',
-                password = 'cisco123'
-                )
-    device.open()
+    logging.info(f'Get cached connection to host {device_hostname}')
+    device = sessions.get(device_hostname)
     logging.info(f'Loading config to {device_hostname}')
     device.load_merge_candidate(config=device_config)
-    menu(f'{device_hostname} Diff')
-    print(device.compare_config())
+    diff = device.compare_config()
+    # Hosts are configured concurrently, keep each diff in one piece
+    with print_lock:
+        menu(f'{device_hostname} Diff')
+        print(diff)
     if commit:
         logging.info(f'Committing config to {device_hostname}')
         device.commit_config()
-    logging.info(f'Close connection with {device_hostname}')
-    device.close()
+    else:
+        logging.info(f'Discarding config on {device_hostname}')
+        device.discard_config()
 
 
-def validatePing(device_hostname, neighbor):
-    """Function to ping test connected neighbor based on configured interface.
-    Checks to determine which interface is within the same subnet.
+def interfaceIPs(device_hostname):
+    """Function to get the device's interface IPs once per run using the NAPALM get_interfaces_ip getter.
 
     Args:
         device_hostname (str): Hostname associated with the device, used to connect to the device.
-        neighbor (str): IP address of neighbor directly connected.
 
     Returns:
-        string: 'success' or 'fail' is returned based on ping response 3+ echo  is success
+        set: IPv4 addresses configured on the device.
     """
-    logging.info('Set NAPALM driver to ios')
-    driver = get_network_driver("ios")
-    logging.info(f'Connecting to host {device_hostname}')
-    # I have hardcoded the user/pass, other options would be collecting creds from a secured source/vault or collecting from user on script run
-    device = driver(
-                hostname = device_hostname,
-                username = 'cisco',
-                password = 'cisco123'
-                )
-    device.open()
-    logging.info('Get device interface IPs using NAPALM get_interfaces_ip getter')
-    output = device.get_interfaces_ip()
-    for interface in output:
-        for key in output[interface]['ipv4'].keys():
-            cidr = output[interface]['ipv4'][key]['prefix_length']
-            logging.info(f'Check if {key}/{cidr} contains neighbor {neighbor}')
-            if neighbor in IPNetwork(f'{key}/{cidr}'):
-                ping_result = device.ping(neighbor, source=key)
-                # Choosing 2 because the first few packets can be dropped
-                if ping_result['success']['packet_loss'] > 2:
-                    logging.warning(f'{device_hostname}: neighbor {neighbor}, ping fail')
-                    return 'fail'
-                else:
-                    logging.info(f'{device_hostname}: neighbor {key}, ping success')
-                    return 'success'
-    logging.info(f'Close connection with {device_hostname}')
-    device.close()
+    if device_hostname not in interface_ips:
+        logging.info(f'Get cached connection to host {device_hostname}')
+        device = sessions.get(device_hostname)
+        logging.info('Get device interface IPs using NAPALM get_interfaces_ip getter')
+        output = device.get_interfaces_ip()
+        interface_ips[device_hostname] = {ip for interface in output for ip in output[interface].get('ipv4', {})}
+    return interface_ips[device_hostname]
+
+
+def validateLinks(device_hostname, pings):
+    """Function to ping test every link the host was given, over its one cached connection.
+
+    Args:
+        device_hostname (str): Hostname associated with the device, used to connect to the device.
+        pings (list): topology.Ping entries with the source and target address of each link.
+
+    Returns:
+        bool: Returns a bool True when every link passed, False when a ping failed
+    """
+    device = sessions.get(device_hostname)
+    configured = interfaceIPs(device_hostname)
+    passed = True
+    for ping in pings:
+        if ping.source_ip not in configured:
+            logging.warning(f'{device_hostname}: {ping.source_ip} is not configured, cannot test link to {ping.peer}')
+            passed = False
+            continue
+        ping_result = device.ping(ping.target_ip, source=ping.source_ip)
+        # Choosing 2 because the first few packets can be dropped
+        if 'success' not in ping_result or ping_result['success']['packet_loss'] > 2:
+            logging.warning(f'{device_hostname}: neighbor {ping.peer} {ping.target_ip}, ping fail')
+            passed = False
+        else:
+            logging.info(f'{device_hostname}: neighbor {ping.peer} {ping.target_ip}, ping success')
+    return passed
 
 
 def validateBGP(device_hostname):
@@ -134,17 +148,8 @@ def validateBGP(device_hostname):
         dict: Dictionary containing neighbors with Up/Down flag.
             Example: {'UP': ['x.x.x.x'], 'DOWN': ['x.x.x.x']}
     """
-    driver = get_network_driver("ios")
-    logging.info('Set NAPALM driver to ios')
-    driver = get_network_driver("ios")
-    logging.info(f'Connecting to host {device_hostname}')
-    # I have hardcoded the user/pass, other options would be collecting creds from a secured source/vault or collecting from user on script run
-    device = driver(
-                hostname = device_hostname,
-                username = 'cisco',
-                password = 'cisco123'
-                )
-    device.open()
+    logging.info(f'Get cached connection to host {device_hostname}')
+    device = sessions.get(device_hostname)
     logging.info('Get BGP neighbors using NAPALM get_bgp_neighbors getter')
     output = device.get_bgp_neighbors()
     logging.info('Initialize bgp validation dictionary')
@@ -159,8 +164,6 @@ def validateBGP(device_hostname):
             else:
                 logging.warning(f'{device_hostname}: peer {peer_ip} is Down')
                 bgp_validation['DOWN'].append(peer_ip)
-    logging.info(f'Close connection with {device_hostname}')
-    device.close()
     return bgp_validation
 
 
@@ -169,36 +172,73 @@ def main():
     """
     logging.basicConfig(level=logging.INFO)
     data = extractYAML('./input/config.yaml')
-
-    menu('Configure Interfaces')
-    for host in data:
-        logging.info(f'Render interface config from YAML vars for {host}')
-        interface_config = renderJinja2('interfaces.j2', data[host])
+    # Addressing and BGP mistakes show up here instead of after minutes of configuration
+    problems = preflight(data)
+    if problems:
+        for problem in problems:
+            logging.error(f'config.yaml: {problem}')
+        sys.exit(1)
+
+    logging.info('Build interface and BGP config from YAML vars for all hosts')
+    build = Build()
+    hashes = build.build(data)
+    deployed = DeployedState()
+    hosts = [host for host in data if force or deployed.changed(host, hashes[host])]
+    if not hosts:
+        logging.info('No host config changed since the last deploy, nothing to push')
+        return
+    logging.info(f'Pushing to {len(hosts)} of {len(hashes)} hosts: {", ".join(hosts)}')
+    configs = {host: build.configs(host) for host in hosts}
+
+    def configureInterfaces(host):
         logging.info(f'Configure interfaces on {host}')
-        configDevice(host, interface_config, commit=True)
-
-
-    menu('Validate L2')
-    for host in data:
-        for item in data[host]['bgp']['neighbors']:
-            neighbor_addr = item['ipaddr']
-            logging.info(f'Validate connectivity based on neighbor {neighbor_addr}')
-            if validatePing(host, neighbor_addr) == 'fail':
-                logging.warning(f'{host} failed to ping {neighbor_addr}, halting run')
-                sys.exit()
-
+        configDevice(host, configs[host]['interfaces'], commit=True)
 
-    menu('Configure BGP')
-    for host in data:
-        logging.info(f'Render BGP config from YAML vars for {host}')
-        bgp_config = renderJinja2('bgp.j2', data[host]['bgp'])
+    def configureBGP(host):
         logging.info(f'Configure BGP on {host}')
-        configDevice(host, bgp_config, commit=True)
-
-
-    menu('Validate BGP')
-    for host in data:
-        print(validateBGP(host))
+        configDevice(host, configs[host]['bgp'], commit=True)
+
+    # Every link pinged once, from one end, instead of from both ends per BGP neighbor
+    pings = ping_plan(data, hosts)
+
+    def validateNeighbors(host):
+        logging.info(f'Validate connectivity on {len(pings[host])} links from {host}')
+        return validateLinks(host, pings[host])
+
+    def printBGP(host):
+        bgp_validation = validateBGP(host)
+        print(bgp_validation)
+        # A host with a peer down fails the phase, so it isn't recorded as deployed
+        return not bgp_validation['DOWN']
+
+    # Each phase runs across all hosts at once, the next phase waits for every host
+    phases = [
+        Phase('Configure Interfaces', configureInterfaces),
+        Phase('Validate L2', validateNeighbors),
+        Phase('Configure BGP', configureBGP),
+    ]
+    bgp_phases = [
+        Phase('Validate BGP', printBGP),
+    ]
+    try:
+        run_phases(phases, hosts, max_workers=max_workers, announce=menu)
+        # Validate as soon as every peer is up instead of after a fixed sleep
+        menu('Wait for BGP')
+        expected = expected_peers({host: data[host] for host in hosts})
+        convergence = wait_for_convergence(sessions.get, expected, timeout=bgp_timeout)
+        for host, peers in convergence.items():
+            for peer, seconds in peers.items():
+                print(f'{host} {peer}: ' + (f'Up after {seconds:.1f}s' if seconds is not None else 'not Up'))
+        run_phases(bgp_phases, hosts, max_workers=max_workers, announce=menu)
+        # Only hosts whose expected peers all came up count as deployed, the rest are retried next run
+        converged = [host for host in hosts if is_converged({host: convergence[host]})]
+        if len(converged) < len(hosts):
+            logging.warning(f'Not recording {", ".join(sorted(set(hosts) - set(converged)))} as deployed, BGP peers not Up')
+        deployed.record({host: hashes[host] for host in converged})
+    except PhaseFailed as e:
+        logging.warning(f'{e}, halting run')
+        sys.exit(1)
 
 if __name__ == "__main__":
-    main()
+    with sessions:
+        main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+def expected_peers(inventory):
+    """Return the BGP neighbors every host should have up, from config.yaml.
+
+    Args:
+        inventory (dict): Parsed config.yaml, host vars keyed by hostname.
+
+    Returns:
+        dict: {hostname: [neighbor IP, ...]}
+    """
+    return {host: [neighbor['ipaddr'] for neighbor in host_vars['bgp']['neighbors']]
+            for host, host_vars in inventory.items()}
+
+
+async def _wait_host(device_hostname, get_device, peers, start, deadline, initial_delay, max_delay):
+    converged = {peer: None for peer in peers}
+    delay = initial_delay
+    while True:
+        try:
+            device = await asyncio.to_thread(get_device, device_hostname)
+            output = await asyncio.to_thread(device.get_bgp_neighbors)
+        except Exception as e:
+            logging.warning(f'{device_hostname}: get_bgp_neighbors failed: {e}')
+            output = {}
+        now = time.monotonic()
+        state = output.get('global', {}).get('peers', {})
+        for peer, seconds in converged.items():
+            if seconds is None and state.get(peer, {}).get('is_up'):
+                converged[peer] = now - start
+                logging.info(f'{device_hostname}: peer {peer} is Up after {converged[peer]:.1f}s')
+        if all(seconds is not None for seconds in converged.values()):
+            return converged
+        remaining = deadline - now
+        if remaining <= 0:
+            down = [peer for peer, seconds in converged.items() if seconds is None]
+            logging.warning(f'{device_hostname}: peers {", ".join(down)} not Up by the deadline')
+            return converged
+        await asyncio.sleep(min(delay, remaining))
+        delay = min(delay * 2, max_delay)
+
+
+async def wait_for_bgp(get_device, expected, timeout=300, initial_delay=1, max_delay=30):
+    """Poll get_bgp_neighbors on every host at once until all expected peers are up.
+
+    Each host backs off exponentially between polls, from initial_delay up to
+    max_delay, and stops as soon as its own peers are up. All hosts share one
+    deadline.
+
+    Args:
+        get_device (callable): Returns an open NAPALM device for a hostname, e.g. SessionManager.get.
+        expected (dict): {hostname: [peer IP, ...]}, see expected_peers.
+        timeout (float, optional): Seconds before giving up on peers still down. Defaults to 300.
+        initial_delay (float, optional): Seconds before the second poll of a host. Defaults to 1.
+        max_delay (float, optional): Longest wait between two polls of a host. Defaults to 30.
+
+    Returns:
+        dict: {hostname: {peer: seconds until it was seen Up, None if it never was}}
+    """
+    start = time.monotonic()
+    deadline = start + timeout
+    loop = asyncio.get_running_loop()
+    # NAPALM getters block, give every host its own thread
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=max(len(expected), 1)))
+    results = await asyncio.gather(*[
+        _wait_host(host, get_device, peers, start, deadline, initial_delay, max_delay)
+        for host, peers in expected.items()])
+    return dict(zip(expected, results))
+
+
+def wait_for_convergence(get_device, expected, **kwargs):
+    """Blocking wrapper around wait_for_bgp for the scripts."""
+    return asyncio.run(wait_for_bgp(get_device, expected, **kwargs))
+
+
+def is_converged(report):
+    """True when every peer in a wait_for_bgp report came up."""
+    return all(seconds is not None for peers in report.values() for seconds in peers.values())
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+import hashlib
+import logging
+import os
+import pickle
+import stat
+import yaml
+from collections.abc import Mapping
+
+# LibYAML's C parser is several times faster when PyYAML was built with it
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
+CACHE_VERSION = 1
+
+
+def _default_cache_dir():
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_home, 'configure_network', 'inventory')
+
+
+def _private_cache_dir(cache_dir):
+    """Create cache_dir with mode 0700, or return None when another user owns it.
+
+    Pickles run code when loaded, so a directory another user created is
+    never read from, and one of ours is closed to other users.
+    """
+    try:
+        os.makedirs(cache_dir, mode=0o700, exist_ok=True)
+        cache_stat = os.lstat(cache_dir)
+    except OSError as e:
+        logging.warning(f'Not caching the inventory, cannot create {cache_dir}: {e}')
+        return None
+    if not stat.S_ISDIR(cache_stat.st_mode) or cache_stat.st_uid != os.getuid():
+        logging.warning(f'Not caching the inventory, {cache_dir} is not a directory owned by this user')
+        return None
+    if cache_stat.st_mode & (stat.S_IRWXG | stat.S_IRWXO):
+        os.chmod(cache_dir, 0o700)
+    return cache_dir
+
+
+def _file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as source:
+        for block in iter(lambda: source.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_yaml(path, cache_dir=None):
+    """Parse a YAML file, reusing a pickled copy while the file is unchanged.
+
+    The cached copy is trusted when the file's mtime and size match. If only
+    the mtime changed (e.g. a fresh checkout) the content hash decides.
+
+    Args:
+        path (str): YAML file to load.
+        cache_dir (str, optional): Directory of pickled copies, only used when it is
+            owned by this user and not open to others. Defaults to ~/.cache/configure_network/inventory.
+
+    Returns:
+        Parsed YAML content.
+    """
+    cache_dir = _private_cache_dir(cache_dir or _default_cache_dir())
+    path = os.path.abspath(path)
+    if cache_dir is None:
+        with open(path) as source:
+            return yaml.load(source, Loader=SafeLoader)
+    cache_file = os.path.join(cache_dir, hashlib.sha256(path.encode()).hexdigest() + '.pickle')
+    file_stat = os.stat(path)
+    cached = None
+    if os.path.exists(cache_file):
+        try:
+            with open(cache_file, 'rb') as cache:
+                cached = pickle.load(cache)
+        except Exception as e:
+            logging.warning(f'Ignoring unreadable inventory cache {cache_file}: {e}')
+    if cached and cached['version'] == CACHE_VERSION:
+        if (cached['mtime_ns'], cached['size']) == (file_stat.st_mtime_ns, file_stat.st_size):
+            return cached['data']
+    file_hash = _file_hash(path)
+    if cached and cached['version'] == CACHE_VERSION and cached['hash'] == file_hash:
+        data = cached['data']
+    else:
+        logging.info(f'Parsing {path}')
+        with open(path) as source:
+            data = yaml.load(source, Loader=SafeLoader)
+    temp_file = f'{cache_file}.{os.getpid()}.tmp'
+    with open(temp_file, 'wb') as cache:
+        pickle.dump({'version': CACHE_VERSION, 'mtime_ns': file_stat.st_mtime_ns, 'size': file_stat.st_size,
+                     'hash': file_hash, 'data': data}, cache, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temp_file, cache_file)
+    return data
+
+
+class ShardedInventory(Mapping):
+    """Inventory split into one {hostname}.yaml file per host, loaded on first access.
+
+    Only the directory listing is read up front, so a run against a few hosts
+    of a large topology parses just those hosts' files.
+
+    Args:
+        directory (str): Directory of per-host YAML files.
+        cache_dir (str, optional): See load_yaml. Defaults to ~/.cache/configure_network/inventory.
+    """
+
+    def __init__(self, directory, cache_dir=None):
+        self.directory = directory
+        self.cache_dir = cache_dir
+        self._files = {}
+        for name in sorted(os.listdir(directory)):
+            host, ext = os.path.splitext(name)
+            if ext in ('.yaml', '.yml'):
+                self._files[host] = os.path.join(directory, name)
+        self._hosts = {}
+
+    def __getitem__(self, host):
+        if host not in self._hosts:
+            self._hosts[host] = load_yaml(self._files[host], self.cache_dir)
+        return self._hosts[host]
+
+    def __iter__(self):
+        return iter(self._files)
+
+    def __len__(self):
+        return len(self._files)
+
+
+def load_inventory(path, cache_dir=None):
+    """Load host vars keyed by hostname from a YAML file or a directory of per-host files.
+
+    Args:
+        path (str): config.yaml style file, or a directory of {hostname}.yaml files.
+        cache_dir (str, optional): See load_yaml. Defaults to ~/.cache/configure_network/inventory.
+
+    Returns:
+        Mapping: Host vars keyed by hostname.
+    """
+    if os.path.isdir(path):
+        return ShardedInventory(path, cache_dir)
+    return load_yaml(path, cache_dir)
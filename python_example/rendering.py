@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+import logging
+import threading
+from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache
+
+# Config name -> (template file, key of the host vars passed to it, None for all of them)
+HOST_TEMPLATES = {
+    'interfaces': ('interfaces.j2', None),
+    'bgp': ('bgp.j2', 'bgp'),
+}
+
+
+class TemplateRenderer:
+    """Compiles each template once and renders it for as many hosts as needed.
+
+    The Environment keeps compiled templates in memory for the life of the
+    process and a FileSystemBytecodeCache keeps them on disk between runs, so a
+    template is only parsed again when its file changes.
+
+    Args:
+        templates_path (str, optional): Path to directory with j2 templates. Defaults to './templates'.
+        cache_dir (str, optional): Directory for the bytecode cache. Defaults to a per-user temp directory.
+    """
+
+    def __init__(self, templates_path='./templates', cache_dir=None):
+        self.templates_path = templates_path
+        self.env = Environment(
+                    loader=FileSystemLoader(templates_path),
+                    bytecode_cache=FileSystemBytecodeCache(cache_dir),
+                    auto_reload=False
+                    )
+
+    def render(self, template, vars_to_render=None):
+        """Render one template.
+
+        Args:
+            template (string): String specifying filename of template to be used.
+            vars_to_render (dict, optional): Dictionary passed containing key:val pairs for j2 render. Defaults to None.
+
+        Returns:
+            string: String rendered from j2 template.
+        """
+        return self.env.get_template(template).render(vars_to_render or {})
+
+    def render_host(self, host_vars, host_templates=HOST_TEMPLATES):
+        """Render every config for one host.
+
+        Args:
+            host_vars (dict): The host's entry from config.yaml.
+            host_templates (dict, optional): Config name -> (template, vars key). Defaults to HOST_TEMPLATES.
+
+        Returns:
+            dict: Rendered config keyed by config name.
+        """
+        configs = {}
+        for name, (template, vars_key) in host_templates.items():
+            configs[name] = self.render(template, host_vars[vars_key] if vars_key else host_vars)
+        return configs
+
+    def render_all(self, inventory, host_templates=HOST_TEMPLATES):
+        """Render every config for every host in the inventory.
+
+        Args:
+            inventory (dict): Parsed config.yaml, host vars keyed by hostname.
+            host_templates (dict, optional): Config name -> (template, vars key). Defaults to HOST_TEMPLATES.
+
+        Returns:
+            dict: {hostname: {config name: rendered config}}
+        """
+        logging.info(f'Rendering {len(host_templates)} configs for {len(inventory)} hosts')
+        return {host: self.render_host(inventory[host], host_templates) for host in inventory}
+
+
+_renderers = {}
+_renderers_lock = threading.Lock()
+
+
+def get_renderer(templates_path='./templates'):
+    """Return the shared TemplateRenderer for templates_path, creating it on first use."""
+    with _renderers_lock:
+        if templates_path not in _renderers:
+            _renderers[templates_path] = TemplateRenderer(templates_path)
+        return _renderers[templates_path]
+
+
+def render_all(inventory, templates_path='./templates'):
+    """Render every config for every host with the shared renderer, see TemplateRenderer.render_all."""
+    return get_renderer(templates_path).render_all(inventory)
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+import logging
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+# Hosts worked on at once unless the caller says otherwise, each holds a device session
+MAX_WORKERS = 50
+
+
+class PhaseFailed(Exception):
+    """Raised when a host fails a phase, after the rest of the phase is cancelled.
+
+    Args:
+        phase (str): Name of the phase that failed.
+        host (str): Host that failed the phase.
+        error (Exception, optional): Exception raised by the task, None if it returned False.
+    """
+
+    def __init__(self, phase, host, error=None):
+        self.phase = phase
+        self.host = host
+        self.error = error
+        reason = f': {error}' if error else ''
+        super().__init__(f'{host} failed {phase}{reason}')
+
+
+class Phase:
+    """One step of the run, executed for every host before the next step starts.
+
+    Args:
+        name (str): Title printed for the phase, e.g. 'Configure BGP'.
+        task (callable): Function called with a hostname. Returning False or
+            raising marks the host as failed, anything else is a pass.
+    """
+
+    def __init__(self, name, task):
+        self.name = name
+        self.task = task
+
+
+def run_phase(phase, hosts, max_workers=MAX_WORKERS):
+    """Run a phase concurrently across hosts, failing fast on the first failure.
+
+    Hosts not yet started when a failure comes in are cancelled; hosts already
+    talking to their device are allowed to finish so no commit is cut off.
+
+    Args:
+        phase (Phase): Phase to run.
+        hosts (iterable): Hostnames to run the phase against.
+        max_workers (int, optional): Hosts worked on at once. Defaults to MAX_WORKERS.
+
+    Returns:
+        dict: Task return value keyed by hostname.
+    """
+    hosts = list(hosts)
+    results = {}
+    failure = None
+    with ThreadPoolExecutor(max_workers=max(min(max_workers, len(hosts)), 1)) as executor:
+        pending = {executor.submit(phase.task, host): host for host in hosts}
+        while pending and failure is None:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                host = pending.pop(future)
+                try:
+                    results[host] = future.result()
+                except Exception as e:
+                    failure = PhaseFailed(phase.name, host, e)
+                    break
+                if results[host] is False:
+                    failure = PhaseFailed(phase.name, host)
+                    break
+        if failure is not None:
+            logging.warning(f'{failure}, cancelling remaining hosts')
+            for future in pending:
+                future.cancel()
+    if failure is not None:
+        raise failure
+    return results
+
+
+def run_phases(phases, hosts, max_workers=MAX_WORKERS, announce=None):
+    """Run phases in order with a barrier between them.
+
+    Args:
+        phases (list): Phase objects, run in order.
+        hosts (iterable): Hostnames to run every phase against.
+        max_workers (int, optional): Hosts worked on at once. Defaults to MAX_WORKERS.
+        announce (callable, optional): Called with the phase name before it starts.
+
+    Raises:
+        PhaseFailed: The first host failure, later phases are not started.
+
+    Returns:
+        dict: Per-host results keyed by phase name.
+    """
+    hosts = list(hosts)
+    results = {}
+    for phase in phases:
+        if announce:
+            announce(phase.name)
+        results[phase.name] = run_phase(phase, hosts, max_workers=max_workers)
+    return results
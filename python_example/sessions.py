@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+import logging
+import threading
+from napalm import get_network_driver
+
+
+class SessionManager:
+    """Keeps one open NAPALM connection per hostname for the whole run.
+
+    Every phase of configure_network.py used to call get_network_driver() and
+    device.open() again, so a host logged in four or more times per run.
+    SessionManager opens each host once, checks the connection is still alive
+    before handing it out and reconnects when it is not.
+
+    Args:
+        driver_name (str, optional): NAPALM driver to use. Defaults to 'ios'.
+        username (str, optional): Login username. Defaults to 'cisco'.
+        password (str, optional): Login password. Defaults to 'cisco123'.
+    """
+
+    def __init__(self, driver_name='ios', username='cisco', password='cisco123'):
+        self.driver_name = driver_name
+        self.username = username
+        self.password = password
+        self._sessions = {}
+        self._host_locks = {}
+        self._lock = threading.Lock()
+
+    def _host_lock(self, device_hostname):
+        with self._lock:
+            return self._host_locks.setdefault(device_hostname, threading.Lock())
+
+    def _open(self, device_hostname):
+        logging.info(f'Set NAPALM driver to {self.driver_name}')
+        driver = get_network_driver(self.driver_name)
+        logging.info(f'Connecting to host {device_hostname}')
+        # I have hardcoded the user/pass, other options would be collecting creds from a secured source/vault or collecting from user on script run
+        device = driver(
+                    hostname = device_hostname,
+                    username = self.username,
+                    password = self.password
+                    )
+        device.open()
+        return device
+
+    @staticmethod
+    def _is_alive(device):
+        try:
+            return device.is_alive().get('is_alive', False)
+        except Exception:
+            return False
+
+    def get(self, device_hostname):
+        """Return an open connection to device_hostname, reconnecting if needed.
+
+        Args:
+            device_hostname (str): Hostname associated with the device, used to connect to the device.
+
+        Returns:
+            NetworkDriver: Open NAPALM device.
+        """
+        with self._host_lock(device_hostname):
+            device = self._sessions.get(device_hostname)
+            if device is not None and not self._is_alive(device):
+                logging.warning(f'Connection to {device_hostname} is down, reconnecting')
+                self._close_quietly(device_hostname, device)
+                device = None
+            if device is None:
+                device = self._open(device_hostname)
+                self._sessions[device_hostname] = device
+            return device
+
+    def _close_quietly(self, device_hostname, device):
+        try:
+            device.close()
+        except Exception as e:
+            logging.warning(f'Error closing connection with {device_hostname}: {e}')
+        self._sessions.pop(device_hostname, None)
+
+    def close(self, device_hostname):
+        """Close the cached connection to device_hostname, if there is one."""
+        with self._host_lock(device_hostname):
+            device = self._sessions.get(device_hostname)
+            if device is not None:
+                logging.info(f'Close connection with {device_hostname}')
+                self._close_quietly(device_hostname, device)
+
+    def close_all(self):
+        """Close every cached connection."""
+        for device_hostname in list(self._sessions):
+            self.close(device_hostname)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close_all()
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+import logging
+import sys
+from collections import namedtuple
+from netaddr import IPAddress, IPNetwork
+
+# One configured interface address
+Endpoint = namedtuple('Endpoint', ['host', 'interface', 'ip', 'network'])
+# One ping: from source_ip on host to target_ip on peer
+Ping = namedtuple('Ping', ['host', 'source_ip', 'peer', 'target_ip'])
+
+
+def endpoints(inventory):
+    """Yield an Endpoint for every interface address in config.yaml.
+
+    Args:
+        inventory (Mapping): Host vars keyed by hostname.
+    """
+    for host, host_vars in inventory.items():
+        for interface, settings in host_vars.get('interfaces', {}).items():
+            network = IPNetwork(f"{settings['ipaddr']}/{settings['mask']}")
+            yield Endpoint(host, interface, str(network.ip), network.cidr)
+
+
+class Topology:
+    """Indexes of config.yaml built once: subnet -> interfaces, IP -> interface, ASN -> hosts.
+
+    Args:
+        inventory (Mapping): Host vars keyed by hostname.
+    """
+
+    def __init__(self, inventory):
+        self.inventory = inventory
+        self.by_subnet = {}
+        self.by_ip = {}
+        self.by_host = {}
+        self.by_asn = {}
+        self.duplicate_ips = []
+        for endpoint in endpoints(inventory):
+            self.by_subnet.setdefault(endpoint.network, []).append(endpoint)
+            self.by_host.setdefault(endpoint.host, []).append(endpoint)
+            if endpoint.ip in self.by_ip:
+                self.duplicate_ips.append((self.by_ip[endpoint.ip], endpoint))
+            else:
+                self.by_ip[endpoint.ip] = endpoint
+        for host, host_vars in inventory.items():
+            if 'bgp' in host_vars:
+                self.by_asn.setdefault(host_vars['bgp']['asn'], []).append(host)
+        # Endpoints keyed by their address under each mask in use, to find mask mismatches
+        prefixes = {endpoint.network.prefixlen for endpoint in self.by_ip.values()}
+        self._by_prefix = {}
+        for endpoint in self.by_ip.values():
+            for prefix in prefixes:
+                key = (prefix, IPNetwork(f'{endpoint.ip}/{prefix}').cidr)
+                self._by_prefix.setdefault(key, []).append(endpoint)
+
+    def links(self):
+        """Subnets shared by two or more hosts, each listed once.
+
+        Returns:
+            dict: {subnet (IPNetwork): [Endpoint, ...]}
+        """
+        return {subnet: members for subnet, members in self.by_subnet.items()
+                if len({member.host for member in members}) > 1}
+
+    def connected(self, host, ip):
+        """The host's Endpoint whose subnet contains ip, None if ip is not directly connected."""
+        address = IPAddress(ip)
+        for endpoint in self.by_host.get(host, []):
+            if address in endpoint.network:
+                return endpoint
+        return None
+
+    def mask_mismatches(self):
+        """Pairs of interfaces on different hosts where one's subnet contains the other's address under another mask."""
+        mismatches = set()
+        for endpoint in self.by_ip.values():
+            # Every address inside endpoint's subnet, whatever its own mask
+            for other in self._by_prefix.get((endpoint.network.prefixlen, endpoint.network), []):
+                if other.host != endpoint.host and other.network != endpoint.network:
+                    mismatches.add(tuple(sorted((endpoint, other))))
+        return sorted(mismatches)
+
+
+def unique_links(inventory):
+    """Group interfaces by subnet, each subnet with two or more hosts is one link.
+
+    Both ends of a point-to-point link list it in config.yaml; here it shows
+    up once.
+
+    Returns:
+        dict: {subnet (IPNetwork): [Endpoint, ...]} for subnets shared by several hosts.
+    """
+    return Topology(inventory).links()
+
+
+def ping_plan(inventory, hosts=None):
+    """Work out which host pings which address so every link is tested once.
+
+    On each link one end pings every other end. The pinging end is the one,
+    among hosts, with the fewest pings so far, which spreads the work.
+
+    Args:
+        inventory (Mapping): Host vars keyed by hostname.
+        hosts (iterable, optional): Hosts that may ping; links with no end among
+            them are left out. Defaults to every host.
+
+    Returns:
+        dict: {hostname: [Ping, ...]} for every host in hosts.
+    """
+    hosts = list(inventory if hosts is None else hosts)
+    plan = {host: [] for host in hosts}
+    for subnet, members in sorted(unique_links(inventory).items()):
+        sources = [member for member in members if member.host in plan]
+        if not sources:
+            continue
+        source = min(sources, key=lambda member: len(plan[member.host]))
+        for member in members:
+            if member.host != source.host:
+                plan[source.host].append(Ping(source.host, source.ip, member.host, member.ip))
+    return plan
+
+
+def preflight(inventory, topology=None):
+    """Check config.yaml for addressing and BGP mistakes before any device is touched.
+
+    Checks that no address is used twice, that both ends of a link use the same
+    mask, and that every BGP neighbor is an address on a directly connected
+    subnet, belongs to a host whose asn is the neighbor's remote_asn, and that
+    host has a neighbor entry back.
+
+    Args:
+        inventory (Mapping): Host vars keyed by hostname.
+        topology (Topology, optional): Prebuilt index of inventory. Defaults to building one.
+
+    Returns:
+        list: Problem descriptions, empty when the inventory is consistent.
+    """
+    topology = topology or Topology(inventory)
+    problems = []
+    for first, second in topology.duplicate_ips:
+        problems.append(f'{first.ip} is configured on {first.host} {first.interface} '
+                        f'and {second.host} {second.interface}')
+    for first, second in topology.mask_mismatches():
+        problems.append(f'Mask mismatch: {first.host} {first.interface} is {first.ip}/{first.network.prefixlen}, '
+                        f'{second.host} {second.interface} is {second.ip}/{second.network.prefixlen}')
+    for host, host_vars in inventory.items():
+        if 'bgp' not in host_vars:
+            continue
+        local_asn = host_vars['bgp']['asn']
+        for neighbor in host_vars['bgp'].get('neighbors', []):
+            neighbor_ip = neighbor['ipaddr']
+            local = topology.connected(host, neighbor_ip)
+            if local is None:
+                problems.append(f'{host}: BGP neighbor {neighbor_ip} is not in a connected subnet')
+            peer = topology.by_ip.get(neighbor_ip)
+            if peer is None:
+                problems.append(f'{host}: BGP neighbor {neighbor_ip} is not an interface address of any host')
+                continue
+            if peer.host == host:
+                problems.append(f'{host}: BGP neighbor {neighbor_ip} is its own address')
+                continue
+            peer_bgp = inventory[peer.host].get('bgp')
+            if peer_bgp is None:
+                problems.append(f'{host}: BGP neighbor {neighbor_ip} is {peer.host}, which has no BGP config')
+                continue
+            if neighbor['remote_asn'] != peer_bgp['asn']:
+                owners = ', '.join(topology.by_asn.get(neighbor['remote_asn'], [])) or 'no host'
+                problems.append(f'{host}: BGP neighbor {neighbor_ip} remote_asn {neighbor["remote_asn"]} '
+                                f'belongs to {owners}, but {peer.host} is AS {peer_bgp["asn"]}')
+            local_ips = {endpoint.ip for endpoint in topology.by_host.get(host, [])}
+            back = [entry for entry in peer_bgp.get('neighbors', []) if entry['ipaddr'] in local_ips]
+            if not back:
+                problems.append(f'{host}: {peer.host} has no BGP neighbor entry for {host}')
+            elif all(entry['remote_asn'] != local_asn for entry in back):
+                problems.append(f'{peer.host}: BGP neighbor entry for {host} does not use remote_asn {local_asn}')
+    return problems
+
+
+def main():
+    """Check input/config.yaml without touching any device."""
+    from inventory import load_inventory
+    logging.basicConfig(level=logging.INFO)
+    problems = preflight(load_inventory('./input/config.yaml'))
+    for problem in problems:
+        logging.error(problem)
+    if problems:
+        sys.exit(1)
+    logging.info('config.yaml is consistent')
+
+
+if __name__ == "__main__":
+    main()
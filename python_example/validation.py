@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+import copy
+import glob
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from napalm.base.validate import compare
+from inventory import load_yaml
+
+
+class ValidationSuite:
+    """Every validation file parsed once, evaluated with one call per getter per device.
+
+    device.compliance_report() reads its YAML file and runs every getter in it
+    each time it is called, so validating interfaces and BGP cost a file read
+    and a round trip per spec, and two specs using the same getter fetched it
+    twice. ValidationSuite loads templates/validation/{host}_{spec}.yaml once,
+    works out the getters a host's specs need, runs each of them once and
+    checks every spec against those results.
+
+    Args:
+        validation_path (str, optional): Directory of validation files. Defaults to 'templates/validation'.
+    """
+
+    def __init__(self, validation_path='templates/validation'):
+        self.validation_path = validation_path
+        self.specs = {}
+        for path in sorted(glob.glob(os.path.join(validation_path, '*.yaml'))):
+            host, _, spec = os.path.basename(path)[:-len('.yaml')].rpartition('_')
+            if not host:
+                logging.warning(f'Skipping {path}, expected <host>_<spec>.yaml')
+                continue
+            self.specs.setdefault(host, {})[spec] = load_yaml(path)
+        logging.info(f'Loaded {sum(len(specs) for specs in self.specs.values())} validation specs '
+                     f'for {len(self.specs)} hosts')
+
+    def _host_specs(self, device_hostname, specs=None):
+        host_specs = self.specs.get(device_hostname, {})
+        if specs is None:
+            return host_specs
+        return {spec: host_specs[spec] for spec in specs if spec in host_specs}
+
+    @staticmethod
+    def _checks(validation_source):
+        # (getter, expected, report key, kwargs) per entry, as NAPALM reads them
+        for validation_check in validation_source:
+            for getter, expected in validation_check.items():
+                if getter == 'get_config':
+                    continue
+                expected = copy.deepcopy(expected)
+                key = expected.pop('_name', '') or getter
+                kwargs = expected.pop('_kwargs', {})
+                yield getter, expected, key, kwargs
+
+    def getters(self, device_hostname, specs=None):
+        """Return the distinct (getter, kwargs) calls the host's specs need.
+
+        Args:
+            device_hostname (str): Hostname the specs belong to.
+            specs (list, optional): Spec names, e.g. ['bgp']. Defaults to all of the host's specs.
+
+        Returns:
+            dict: {(getter, kwargs as JSON): (getter, kwargs)}
+        """
+        calls = {}
+        for validation_source in self._host_specs(device_hostname, specs).values():
+            for getter, _, _, kwargs in self._checks(validation_source):
+                calls[(getter, json.dumps(kwargs, sort_keys=True))] = (getter, kwargs)
+        return calls
+
+    def validate_host(self, device, device_hostname, specs=None):
+        """Run each needed getter once on device and check every spec against the results.
+
+        Args:
+            device (NetworkDriver): Open NAPALM device.
+            device_hostname (str): Hostname the specs belong to.
+            specs (list, optional): Spec names to check. Defaults to all of the host's specs.
+
+        Returns:
+            dict: {spec: report}, each report shaped like device.compliance_report()'s.
+        """
+        results = {}
+        for call, (getter, kwargs) in self.getters(device_hostname, specs).items():
+            logging.info(f'Running {getter} on {device_hostname}')
+            try:
+                results[call] = getattr(device, getter)(**kwargs)
+            except NotImplementedError:
+                results[call] = NotImplementedError
+        reports = {}
+        for spec, validation_source in self._host_specs(device_hostname, specs).items():
+            report = {}
+            for getter, expected, key, kwargs in self._checks(validation_source):
+                actual = results[(getter, json.dumps(kwargs, sort_keys=True))]
+                if actual is NotImplementedError:
+                    report[key] = {'skipped': True, 'reason': 'NotImplemented'}
+                else:
+                    report[key] = compare(expected, actual)
+            complies = all(entry.get('complies', True) for entry in report.values())
+            report['skipped'] = [key for key, entry in report.items() if entry.get('skipped', False)]
+            report['complies'] = complies
+            reports[spec] = report
+        return reports
+
+    def validate_all(self, get_device, hosts=None, specs=None, max_workers=None):
+        """Validate hosts in parallel.
+
+        Args:
+            get_device (callable): Returns an open NAPALM device for a hostname, e.g. SessionManager.get.
+            hosts (iterable, optional): Hostnames to validate. Defaults to every host with a spec.
+            specs (list, optional): Spec names to check. Defaults to all of them.
+            max_workers (int, optional): Hosts validated at once. Defaults to one per host.
+
+        Returns:
+            dict: {hostname: {spec: report}}
+        """
+        hosts = list(self.specs if hosts is None else hosts)
+
+        def validate(host):
+            # Log in on the pool's thread so cold sessions open in parallel too
+            return self.validate_host(get_device(host), host, specs)
+
+        with ThreadPoolExecutor(max_workers=max_workers or max(len(hosts), 1)) as executor:
+            futures = {host: executor.submit(validate, host) for host in hosts}
+            return {host: future.result() for host, future in futures.items()}
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""Stand-in RADIUS server for load testing radius_auth.py without ClearPass.
+
+Answers PAP Access-Requests on UDP: Access-Accept when the password matches
+the user's row in --credentials (or, without a file, for every user), and
+Access-Reject otherwise.  Requests with a wrong Message-Authenticator are
+dropped like a real server does.  Latency, jitter, random rejects and dropped
+requests can be injected.
+
+Run on its own:
+    python3 scribbles/mock_radius_server.py --port 18120 --secret testing123 --latency 0.005
+"""
+import argparse
+import asyncio
+import hashlib
+import hmac
+import random
+
+from radius_auth import (ACCESS_ACCEPT, ACCESS_REJECT, ACCESS_REQUEST, MESSAGE_AUTHENTICATOR,
+                         USER_NAME, USER_PASSWORD, access_response, decode_attributes,
+                         read_credentials, reveal_password)
+
+
+class MockRadius(asyncio.DatagramProtocol):
+    """Answers Access-Requests from one UDP socket.
+
+    Args:
+        secret (str): Shared secret.
+        users (dict, optional): Password bytes keyed by username bytes. Defaults to accepting everyone.
+        latency (float): Seconds before each reply.
+        jitter (float): Random extra latency, 0 to jitter seconds.
+        reject_rate (float): Share of valid logins rejected anyway, 0 to 1.
+        drop_rate (float): Share of requests never answered, 0 to 1.
+    """
+
+    def __init__(self, secret, users=None, latency=0.0, jitter=0.0, reject_rate=0.0, drop_rate=0.0):
+        self.secret = secret.encode()
+        self.users = users
+        self.latency = latency
+        self.jitter = jitter
+        self.reject_rate = reject_rate
+        self.drop_rate = drop_rate
+        self.transport = None
+        self.counts = {'accept': 0, 'reject': 0, 'dropped': 0, 'invalid': 0}
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def decide(self, request):
+        """Access-Accept or Access-Reject for a request, None to drop it."""
+        if len(request) < 20 or request[0] != ACCESS_REQUEST:
+            return None
+        attributes = {}
+        offset = 20
+        for attr_type, value in decode_attributes(request[20:]):
+            if attr_type == MESSAGE_AUTHENTICATOR:
+                # The signature covers the packet with its own value zeroed
+                zeroed = request[:offset + 2] + bytes(16) + request[offset + 18:]
+                if not hmac.compare_digest(hmac.new(self.secret, zeroed, hashlib.md5).digest(), value):
+                    return None
+            attributes[attr_type] = value
+            offset += len(value) + 2
+        username = attributes.get(USER_NAME, b'')
+        password = reveal_password(attributes.get(USER_PASSWORD, b''), self.secret, request[4:20])
+        if self.users is not None and self.users.get(username) != password:
+            return ACCESS_REJECT
+        if random.random() < self.reject_rate:
+            return ACCESS_REJECT
+        return ACCESS_ACCEPT
+
+    def datagram_received(self, data, addr):
+        try:
+            code = self.decide(data)
+        except ValueError:
+            code = None
+        if code is None:
+            self.counts['invalid'] += 1
+            return
+        if random.random() < self.drop_rate:
+            self.counts['dropped'] += 1
+            return
+        self.counts['accept' if code == ACCESS_ACCEPT else 'reject'] += 1
+        reply = access_response(code, data, self.secret)
+        pause = self.latency + random.uniform(0, self.jitter)
+        if pause:
+            asyncio.get_running_loop().call_later(pause, self.transport.sendto, reply, addr)
+        else:
+            self.transport.sendto(reply, addr)
+
+    async def start(self, host='127.0.0.1', port=18120):
+        """Start listening and return the transport."""
+        transport, _ = await asyncio.get_running_loop().create_datagram_endpoint(
+            lambda: self, local_addr=(host, port))
+        return transport
+
+
+def serve(host='127.0.0.1', port=18120, **settings):
+    """Run a MockRadius server until the process is stopped."""
+    async def run():
+        await MockRadius(**settings).start(host, port)
+        await asyncio.Event().wait()
+
+    asyncio.run(run())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=18120)
+    parser.add_argument('--secret', default='testing123')
+    parser.add_argument('--credentials', metavar='CSV', help='username,password rows to accept; default accept all')
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--reject-rate', type=float, default=0.0)
+    parser.add_argument('--drop-rate', type=float, default=0.0)
+    args = parser.parse_args()
+    users = dict(read_credentials(args.credentials)) if args.credentials else None
+    serve(args.host, args.port, secret=args.secret, users=users, latency=args.latency,
+          jitter=args.jitter, reject_rate=args.reject_rate, drop_rate=args.drop_rate)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,338 @@
-import radius
+#!/usr/bin/env python3
+"""Check RADIUS authentication for one user, or load test a RADIUS server.
+
+Without --load, asks for a username and password and prints success or
+failure.  With --load, reads username,password rows from a CSV file and
+sends PAP Access-Requests over asyncio UDP at --rate per second, with at most
+--concurrency waiting for a reply, then prints the accept/reject/timeout
+counts and p50/p95/p99 latency.  Each UDP socket carries up to 256 requests
+in flight (RADIUS ids are one byte), so one socket is opened per 256 of
+--concurrency.
+
+Against the local stand-in responder:
+    python3 scribbles/mock_radius_server.py --port 18120 --secret testing123 --latency 0.005
+    python3 scribbles/radius_auth.py --load users.csv --server 127.0.0.1 --port 18120 --secret testing123 --count 20000 --rate 2000
+"""
+import argparse
+import asyncio
+import csv
+import hashlib
+import hmac
+import itertools
+import os
+import socket
+import struct
+import time
+from collections import Counter, deque
 from getpass import getpass
 
 radius_secret = "REDCATED"
 radius_server = "REDCATED"
 radius_port = 1812
-user = input('Username:')
-password = getpass()
 
-r = radius.Radius(radius_secret, host=radius_server, port=radius_port)
-print('success' if r.authenticate(user, password) else 'failure')
+ACCESS_REQUEST = 1
+ACCESS_ACCEPT = 2
+ACCESS_REJECT = 3
+ACCESS_CHALLENGE = 11
+RESULTS = {ACCESS_ACCEPT: 'accept', ACCESS_REJECT: 'reject', ACCESS_CHALLENGE: 'challenge'}
+
+USER_NAME = 1
+USER_PASSWORD = 2
+NAS_IDENTIFIER = 32
+MESSAGE_AUTHENTICATOR = 80
+
+
+def encode_attributes(attributes):
+    """Pack [(type, value bytes), ...] as RADIUS attributes."""
+    return b''.join(struct.pack('!BB', attr_type, len(value) + 2) + value for attr_type, value in attributes)
+
+
+def decode_attributes(data):
+    """Unpack RADIUS attributes into [(type, value bytes), ...]."""
+    attributes = []
+    offset = 0
+    while offset + 2 <= len(data):
+        attr_type, length = data[offset], data[offset + 1]
+        if length < 2 or offset + length > len(data):
+            raise ValueError('Malformed attribute {} at offset {}'.format(attr_type, offset))
+        attributes.append((attr_type, data[offset + 2:offset + length]))
+        offset += length
+    return attributes
+
+
+def _password_keys(secret, authenticator, blocks):
+    # RFC 2865 5.2: the key of each 16 byte block is MD5(secret + previous ciphertext block)
+    previous = authenticator
+    for block in blocks:
+        yield hashlib.md5(secret + previous).digest()
+        previous = block
+
+
+def hide_password(password, secret, authenticator):
+    """Encrypt a User-Password value with the shared secret and Request Authenticator."""
+    padded = password.ljust(max(16, len(password) + -len(password) % 16), b'\0')
+    hidden = b''
+    previous = authenticator
+    for start in range(0, len(padded), 16):
+        key = hashlib.md5(secret + previous).digest()
+        previous = bytes(a ^ b for a, b in zip(padded[start:start + 16], key))
+        hidden += previous
+    return hidden
+
+
+def reveal_password(hidden, secret, authenticator):
+    """Decrypt a User-Password value, the reverse of hide_password."""
+    blocks = [hidden[start:start + 16] for start in range(0, len(hidden), 16)]
+    password = b''.join(bytes(a ^ b for a, b in zip(block, key))
+                        for block, key in zip(blocks, _password_keys(secret, authenticator, blocks)))
+    return password.rstrip(b'\0')
+
+
+def _sign(packet, secret):
+    # Message-Authenticator is the last attribute; HMAC-MD5 over the packet with it zeroed (RFC 3579 3.2)
+    return packet[:-16] + hmac.new(secret, packet, hashlib.md5).digest()
+
+
+def access_request(identifier, username, password, secret, nas_identifier=b'radius-load-test'):
+    """Build a PAP Access-Request carrying a Message-Authenticator.
+
+    Returns:
+        tuple: (packet bytes, Request Authenticator bytes)
+    """
+    authenticator = os.urandom(16)
+    body = encode_attributes([(USER_NAME, username),
+                              (USER_PASSWORD, hide_password(password, secret, authenticator)),
+                              (NAS_IDENTIFIER, nas_identifier),
+                              (MESSAGE_AUTHENTICATOR, bytes(16))])
+    packet = struct.pack('!BBH', ACCESS_REQUEST, identifier, 20 + len(body)) + authenticator + body
+    return _sign(packet, secret), authenticator
+
+
+def access_response(code, request, secret, attributes=()):
+    """Build the reply to an Access-Request, with Message-Authenticator and Response Authenticator."""
+    body = encode_attributes(list(attributes) + [(MESSAGE_AUTHENTICATOR, bytes(16))])
+    header = struct.pack('!BBH', code, request[1], 20 + len(body))
+    # Both authenticators are computed with the Request Authenticator in place
+    packet = _sign(header + request[4:20] + body, secret)
+    return header + hashlib.md5(packet + secret).digest() + packet[20:]
+
+
+def verify_response(packet, secret, request_authenticator):
+    """True when packet's Response Authenticator matches the request it claims to answer."""
+    if len(packet) < 20:
+        return False
+    length = struct.unpack('!H', packet[2:4])[0]
+    if length < 20 or length > len(packet):
+        return False
+    expected = hashlib.md5(packet[:4] + request_authenticator + packet[20:length] + secret).digest()
+    return hmac.compare_digest(expected, packet[4:20])
+
+
+def read_credentials(path):
+    """Read username,password rows, skipping blank lines and # comments.
+
+    Returns:
+        list: [(username bytes, password bytes), ...]
+    """
+    credentials = []
+    with open(path, newline='') as csv_file:
+        for row in csv.reader(csv_file):
+            if not row or not row[0].strip() or row[0].startswith('#'):
+                continue
+            credentials.append((row[0].strip().encode(), (row[1] if len(row) > 1 else '').encode()))
+    return credentials
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100.0 * (len(values) - 1))))]
+
+
+class _RadiusSocket(asyncio.DatagramProtocol):
+    """One UDP socket and the requests waiting for a reply on it, keyed by RADIUS id."""
+
+    def __init__(self, secret):
+        self.secret = secret
+        self.transport = None
+        self.pending = {}
+        self.invalid = 0
+
+    def connection_made(self, transport):
+        self.transport = transport
+        try:
+            # Replies arrive in bursts at high rates; a small buffer drops them
+            transport.get_extra_info('socket').setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+        except OSError:
+            pass
+
+    def datagram_received(self, data, addr):
+        waiting = self.pending.get(data[1]) if len(data) >= 20 else None
+        if waiting is None:
+            # Late reply to a request that already timed out
+            return
+        authenticator, future = waiting
+        if future.done():
+            return
+        if verify_response(data, self.secret, authenticator):
+            future.set_result(data[0])
+        else:
+            self.invalid += 1
+
+    def error_received(self, exc):
+        # ICMP errors such as port unreachable; the requests run into their timeout
+        pass
+
+
+class RadiusLoadTester:
+    """Sends many Access-Requests concurrently over UDP and collects accept/reject counts and latency.
+
+    Args:
+        server (str): RADIUS server address.
+        secret (str): Shared secret.
+        port (int, optional): RADIUS authentication port. Defaults to 1812.
+        rate (float, optional): Access-Requests started per second, 0 for as fast as
+            concurrency allows. Defaults to 100.
+        concurrency (int, optional): Requests waiting for a reply at once. Defaults to 256.
+        timeout (float, optional): Seconds to wait for a reply before retransmitting. Defaults to 5.
+        retries (int, optional): Retransmissions before a request counts as timed out. Defaults to 0.
+        nas_identifier (str, optional): NAS-Identifier sent in each request. Defaults to 'radius-load-test'.
+    """
+
+    def __init__(self, server, secret, port=1812, rate=100, concurrency=256, timeout=5, retries=0,
+                 nas_identifier='radius-load-test'):
+        self.server = server
+        self.secret = secret.encode()
+        self.port = port
+        self.rate = rate
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.retries = retries
+        self.nas_identifier = nas_identifier.encode()
+
+    async def run_async(self, credentials, count=None):
+        """Authenticate every (username, password), cycling through them when count is larger.
+
+        Args:
+            credentials (list): (username bytes, password bytes) pairs, e.g. from read_credentials.
+            count (int, optional): Access-Requests to send. Defaults to one per credential.
+
+        Returns:
+            dict: Counts per outcome, elapsed seconds, achieved rate and latency percentiles in ms.
+        """
+        loop = asyncio.get_running_loop()
+        sockets = []
+        for _ in range(-(-self.concurrency // 256)):
+            _, protocol = await loop.create_datagram_endpoint(
+                lambda: _RadiusSocket(self.secret), remote_addr=(self.server, self.port))
+            sockets.append(protocol)
+        # Free ids go to the back, so a just released id is reused last
+        free_ids = deque((protocol, identifier) for identifier in range(256) for protocol in sockets)
+        slots = asyncio.Semaphore(self.concurrency)
+        outcomes = Counter()
+        latencies = []
+
+        async def authenticate(username, password):
+            protocol, identifier = free_ids.popleft()
+            packet, authenticator = access_request(identifier, username, password, self.secret,
+                                                   self.nas_identifier)
+            future = loop.create_future()
+            protocol.pending[identifier] = (authenticator, future)
+            started = time.monotonic()
+            try:
+                for _ in range(self.retries + 1):
+                    protocol.transport.sendto(packet)
+                    try:
+                        code = await asyncio.wait_for(asyncio.shield(future), self.timeout)
+                    except asyncio.TimeoutError:
+                        continue
+                    latencies.append(time.monotonic() - started)
+                    outcomes[RESULTS.get(code, 'other')] += 1
+                    return
+                outcomes['timeout'] += 1
+            finally:
+                del protocol.pending[identifier]
+                free_ids.append((protocol, identifier))
+                slots.release()
+
+        if count is not None:
+            credentials = itertools.islice(itertools.cycle(credentials), count)
+        interval = 1.0 / self.rate if self.rate else 0.0
+        tasks = set()
+        sent = 0
+        started = next_send = time.monotonic()
+        try:
+            for username, password in credentials:
+                await slots.acquire()
+                delay = next_send - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                # Make up for sleep overshoot, but don't burst to make up time spent waiting for a slot
+                next_send = max(next_send, time.monotonic() - 0.05) + interval
+                task = asyncio.ensure_future(authenticate(username, password))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+                sent += 1
+            await asyncio.gather(*tasks)
+        finally:
+            for protocol in sockets:
+                protocol.transport.close()
+        elapsed = time.monotonic() - started
+        report = {'sent': sent}
+        for outcome in ('accept', 'reject', 'challenge', 'timeout', 'other'):
+            report[outcome] = outcomes[outcome]
+        report['invalid_replies'] = sum(protocol.invalid for protocol in sockets)
+        report['seconds'] = round(elapsed, 2)
+        report['requests_per_sec'] = round(sent / elapsed, 1) if elapsed else 0.0
+        for pct in (50, 95, 99):
+            report['p{}_ms'.format(pct)] = round(percentile(latencies, pct) * 1000, 2)
+        report['max_ms'] = round(max(latencies, default=0.0) * 1000, 2)
+        return report
+
+    def run(self, credentials, count=None):
+        """Blocking run_async for callers without an event loop."""
+        return asyncio.run(self.run_async(credentials, count))
+
+
+def authenticate_one(server, port, secret):
+    """Ask for one username and password and print whether the server accepted them."""
+    import radius
+    user = input('Username:')
+    password = getpass()
+
+    r = radius.Radius(secret, host=server, port=port)
+    print('success' if r.authenticate(user, password) else 'failure')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--load', metavar='CSV', help='username,password rows to send as a load test')
+    parser.add_argument('--server', default=radius_server)
+    parser.add_argument('--port', type=int, default=radius_port)
+    parser.add_argument('--secret', default=radius_secret)
+    parser.add_argument('--count', type=int, help='Requests to send, cycling through the CSV; default one per row')
+    parser.add_argument('--rate', type=float, default=100, help='Requests per second, 0 for unlimited')
+    parser.add_argument('--concurrency', type=int, default=256, help='Requests waiting for a reply at once')
+    parser.add_argument('--timeout', type=float, default=5)
+    parser.add_argument('--retries', type=int, default=0)
+    parser.add_argument('--nas-identifier', default='radius-load-test')
+    args = parser.parse_args()
+
+    if not args.load:
+        authenticate_one(args.server, args.port, args.secret)
+        return
+    credentials = read_credentials(args.load)
+    if not credentials:
+        parser.error('No credentials in {}'.format(args.load))
+    tester = RadiusLoadTester(args.server, args.secret, port=args.port, rate=args.rate,
+                              concurrency=args.concurrency, timeout=args.timeout,
+                              retries=args.retries, nas_identifier=args.nas_identifier)
+    report = tester.run(credentials, args.count)
+    print('{sent} sent in {seconds}s ({requests_per_sec}/s): {accept} accept, {reject} reject, '
+          '{challenge} challenge, {timeout} timeout, {other} other, {invalid_replies} invalid replies'.format(**report))
+    print('latency of answered requests, ms: p50 {p50_ms}  p95 {p95_ms}  p99 {p99_ms}  max {max_ms}'.format(**report))
+
+
+if __name__ == '__main__':
+    main()
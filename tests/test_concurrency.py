@@ -0,0 +1,30 @@
+from aruba_common.concurrency import AdaptiveLimiter
+from aruba_common.engine import DeviceResult
+
+
+def finish(limiter, host, ok=True, error=None):
+    assert limiter.try_acquire(host)
+    limiter.release(DeviceResult(host, host, ok, error=error))
+
+
+def test_slow_start_doubles_each_round():
+    limiter = AdaptiveLimiter(initial=10, maximum=400)
+    for num in range(10):
+        finish(limiter, 'dc-{}'.format(num))
+    assert limiter.limits == {'all': 20}
+
+
+def test_congestion_ends_slow_start():
+    limiter = AdaptiveLimiter(initial=10, maximum=400, cooldown=0)
+    finish(limiter, 'wan-1', ok=False, error=TimeoutError())
+    assert limiter.limits == {'all': 5}
+    for num in range(5):
+        finish(limiter, 'wan-{}'.format(num))
+    assert limiter.limits == {'all': 5}
+
+
+def test_group_at_limit_does_not_block_other_groups():
+    limiter = AdaptiveLimiter(initial=1, maximum=400, group_of=lambda host: host.split('-')[0])
+    assert limiter.try_acquire('wan-1')
+    assert not limiter.try_acquire('wan-2')
+    assert limiter.try_acquire('dc-1')
@@ -0,0 +1,78 @@
+from aruba_common.config_diff import missing_lines, parse_running_config
+
+RUNNING_CONFIG = '''hostname "ctrl1"
+ip name-server 10.0.0.53
+aaa profile "a"
+   authentication-dot1x "d"
+   dot1x-default-role "employee"
+!
+aaa profile "c"
+!
+'''
+
+
+def test_parse_running_config():
+    sections = parse_running_config(RUNNING_CONFIG)
+    assert sections['aaa profile "a"'] == {'authentication-dot1x "d"', 'dot1x-default-role "employee"'}
+    assert sections['aaa profile "c"'] == set()
+    assert sections['ip name-server 10.0.0.53'] == set()
+
+
+def test_compliant_flat_lines():
+    assert missing_lines(['ip name-server 10.0.0.53', 'aaa profile "a"', 'authentication-dot1x "d"'],
+                         RUNNING_CONFIG) == []
+
+
+def test_flat_new_context_after_existing_one_is_sent_whole():
+    lines = ['aaa profile "a"', 'authentication-dot1x "d"', 'aaa profile "b"', 'authentication-dot1x "d"']
+    assert missing_lines(lines, RUNNING_CONFIG) == lines
+
+
+def test_flat_new_context_first():
+    lines = ['aaa profile "b"', 'authentication-dot1x "d"', 'ip name-server 10.0.0.53']
+    assert missing_lines(lines, RUNNING_CONFIG) == ['aaa profile "b"', 'authentication-dot1x "d"']
+
+
+def test_flat_missing_sub_command_resends_block():
+    lines = ['aaa profile "a"', 'authentication-dot1x "d"', 'dot1x-server-group "radius"']
+    assert missing_lines(lines, RUNNING_CONFIG) == lines
+
+
+def test_flat_no_of_absent_line_is_compliant():
+    assert missing_lines(['aaa profile "a"', 'no dot1x-server-group "radius"'], RUNNING_CONFIG) == []
+    assert missing_lines(['no ip name-server 10.0.0.54'], RUNNING_CONFIG) == []
+
+
+def test_flat_no_of_top_level_line_is_sent():
+    lines = ['aaa profile "a"', 'no ip name-server 10.0.0.53']
+    assert missing_lines(lines, RUNNING_CONFIG) == lines
+
+
+def test_indented_sends_only_missing_sub_commands():
+    lines = ['aaa profile "a"', '   authentication-dot1x "d"', '   dot1x-server-group "radius"',
+             'aaa profile "b"', '   authentication-dot1x "d"']
+    assert missing_lines(lines, RUNNING_CONFIG) == [
+        'aaa profile "a"', '   dot1x-server-group "radius"',
+        'aaa profile "b"', '   authentication-dot1x "d"']
+
+
+def test_terminated_contexts():
+    lines = ['aaa profile "a"', 'authentication-dot1x "d"', '!',
+             'aaa profile "c"', 'authentication-dot1x "d"', '!',
+             'aaa profile "b"', 'authentication-dot1x "d"', 'exit']
+    assert missing_lines(lines, RUNNING_CONFIG) == [
+        'aaa profile "c"', 'authentication-dot1x "d"', '!',
+        'aaa profile "b"', 'authentication-dot1x "d"', 'exit']
+
+
+def test_new_top_level_line_is_sent():
+    assert missing_lines(['ip name-server 10.0.0.54', ''], RUNNING_CONFIG) == ['ip name-server 10.0.0.54']
+
+
+def test_no_without_arguments_removes_a_configured_line():
+    running_config = 'interface vlan 10\n   ip address 10.0.0.1 255.255.255.0\n   description "users"\n!\n'
+    lines = ['interface vlan 10', 'no ip address', 'no description']
+    assert missing_lines(lines, running_config) == lines
+    assert missing_lines(['interface vlan 10', 'no shutdown'], running_config) == []
+    indented = ['interface vlan 10', '   no ip address']
+    assert missing_lines(indented, running_config) == indented
@@ -0,0 +1,17 @@
+from aruba_common.csv_groups import grouped_rows
+
+
+def write_csv(tmp_path, rows):
+    path = tmp_path / 'conf.csv'
+    path.write_text('hostname,conf\n' + ''.join('{},{}\n'.format(*row) for row in rows))
+    return str(path)
+
+
+def test_unsorted_rows_are_merged_per_host(tmp_path):
+    path = write_csv(tmp_path, [('ctrl1', 'a'), ('ctrl2', 'b'), ('ctrl1', 'c')])
+    assert sorted(grouped_rows(path)) == [['ctrl1', ['a', 'c']], ['ctrl2', ['b']]]
+
+
+def test_sorted_rows_are_streamed(tmp_path):
+    path = write_csv(tmp_path, [('ctrl1', 'a'), ('ctrl1', 'c'), ('ctrl2', 'b')])
+    assert list(grouped_rows(path, sorted_input=True)) == [['ctrl1', ['a', 'c']], ['ctrl2', ['b']]]
@@ -0,0 +1,90 @@
+import asyncio
+import socket
+import threading
+import time
+
+import pytest
+
+from aruba_common import distributed
+from aruba_common.concurrency import AdaptiveLimiter
+from aruba_common.distributed import Coordinator, RemoteQueue, run_distributed
+from aruba_common.engine import host_of, run_fleet, run_fleet_async
+from aruba_common.metrics import site_from_hostname
+from aruba_common.script import run_script
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def test_coordinator_leases_items_while_the_source_is_read():
+    address = '127.0.0.1:{}'.format(free_port())
+    read = []
+
+    def source():
+        for num in range(50):
+            read.append(num)
+            yield 'host{}'.format(num)
+
+    async def task(host):
+        # The first leases go out before the coordinator read the whole source
+        return len(read)
+
+    async def run():
+        coordinator = Coordinator(source(), address, verbose=False, buffer=10)
+        serving = asyncio.ensure_future(coordinator.serve())
+        remote = RemoteQueue(address, batch=5)
+        await run_fleet_async(remote.items(), task, max_concurrency=5, journal=remote, verbose=False)
+        return await serving
+
+    report = asyncio.run(run())
+    assert sorted(result.host for result in report.succeeded) == sorted('host{}'.format(num) for num in range(50))
+    assert min(result.output for result in report.results) < 50
+
+
+def test_late_worker_gets_a_share(monkeypatch):
+    address = '127.0.0.1:{}'.format(free_port())
+    hosts = ['dc-{}'.format(num) for num in range(800)]
+
+    def run_without_sessions(items, task, username, password, key=host_of, **kwargs):
+        # run_sessions minus the netmiko login
+        return run_fleet(items, lambda item: task(None, item), key=key, **kwargs)
+
+    def device_task(ssh_session, host):
+        time.sleep(0.1)
+
+    def worker(reports):
+        limiter = AdaptiveLimiter(maximum=40, group_of=site_from_hostname)
+        reports.append(run_distributed([], device_task, 'user', 'pass', argv=['--worker', address],
+                                       limiter=limiter, verbose=False))
+
+    monkeypatch.setattr(distributed, 'run_sessions', run_without_sessions)
+    coordinator = Coordinator(hosts, address, verbose=False)
+    first, second = [], []
+    threads = [threading.Thread(target=worker, args=(first,)), threading.Thread(target=worker, args=(second,))]
+
+    async def serve():
+        served = asyncio.ensure_future(coordinator.serve())
+        threads[0].start()
+        await asyncio.sleep(0.15)
+        threads[1].start()
+        return await served
+
+    report = asyncio.run(serve())
+    for thread in threads:
+        thread.join()
+    assert len(report.succeeded) == 800
+    assert len(first[0].results) + len(second[0].results) == 800
+    assert len(second[0].results) >= 200
+
+
+def test_local_only_run_refuses_fleet_roles(tmp_path):
+    def run(items, journal=None, metrics=None):
+        raise AssertionError('should not run')
+
+    for role in ('--coordinator', '--worker'):
+        with pytest.raises(SystemExit):
+            run_script(str(tmp_path / 'aruba_reboot.py'), ['ctrl1'], None, 'user', 'pass',
+                       run=run, argv=['--rolling', role, '127.0.0.1:1'])
@@ -0,0 +1,36 @@
+import asyncio
+
+from aruba_common.engine import run_fleet_async
+from aruba_common.rolling import SiteCaps
+
+
+def site(host):
+    return host.split('-')[0]
+
+
+def run_sorted_by_site(limiter, sites=5, per_site=40):
+    hosts = ['site{}-{}'.format(num, host) for num in range(sites) for host in range(per_site)]
+    in_flight = {'now': 0, 'peak': 0}
+
+    async def task(host):
+        in_flight['now'] += 1
+        in_flight['peak'] = max(in_flight['peak'], in_flight['now'])
+        await asyncio.sleep(0.01)
+        in_flight['now'] -= 1
+
+    report = asyncio.run(run_fleet_async(hosts, task, limiter=limiter, verbose=False))
+    return report, in_flight['peak']
+
+
+def test_capped_site_does_not_hold_back_other_sites():
+    report, peak = run_sorted_by_site(SiteCaps(20, 2, group_of=site))
+    assert len(report.succeeded) == 200
+    assert peak == 10
+
+
+def test_site_caps_are_kept():
+    caps = SiteCaps(20, 2, group_of=site)
+    assert caps.try_acquire('site0-1')
+    assert caps.try_acquire('site0-2')
+    assert not caps.try_acquire('site0-3')
+    assert caps.try_acquire('site1-1')
@@ -0,0 +1,24 @@
+from aruba_common.engine import DeviceResult
+from aruba_common.journal import RunJournal
+
+
+def test_host_queued_twice_is_tracked_per_item(tmp_path):
+    path = str(tmp_path / 'csv_conf.journal.jsonl')
+    failed_item, ok_item = ['ctrl1', 'ip name-server 10.0.0.5'], ['ctrl1', 'ntp server 10.0.0.6']
+    with RunJournal(path) as journal:
+        journal.record(DeviceResult('ctrl1', failed_item, False, error=TimeoutError()))
+        journal.record(DeviceResult('ctrl1', ok_item, True))
+    with RunJournal(path, resume=True) as journal:
+        assert not journal.succeeded(failed_item)
+        assert journal.succeeded(ok_item)
+
+
+def test_latest_entry_wins(tmp_path):
+    path = str(tmp_path / 'write_mem.journal.jsonl')
+    with RunJournal(path) as journal:
+        journal.record(DeviceResult('ctrl1', 'ctrl1', False, error=TimeoutError()))
+        journal.record(DeviceResult('ctrl1', 'ctrl1', True))
+        journal.record(DeviceResult('ctrl2', 'ctrl2', False, error=TimeoutError()))
+    with RunJournal(path, resume=True) as journal:
+        assert journal.succeeded('ctrl1')
+        assert not journal.succeeded('ctrl2')
@@ -0,0 +1,56 @@
+from aruba_common.streaming import CTRL_C, stream_command
+
+
+class FakeSession:
+    """Hands out one queued chunk per read_channel, like a netmiko channel."""
+
+    base_prompt = 'ctrl'
+
+    def __init__(self, chunks):
+        self.chunks = list(chunks)
+        self.sent = []
+
+    def clear_buffer(self):
+        pass
+
+    def normalize_cmd(self, command):
+        return command + '\n'
+
+    def write_channel(self, data):
+        self.sent.append(data)
+
+    def read_channel(self):
+        return self.chunks.pop(0) if self.chunks else ''
+
+    def read_until_pattern(self, **kwargs):
+        return ''
+
+
+CHUNKS = ['show user\n'] + ['10.0.0.{} user\n'.format(num) for num in range(200)] + ['(ctrl) #']
+
+
+def test_batches_grow_up_to_max_batch():
+    batches = []
+    assert not stream_command(FakeSession(CHUNKS), 'show user',
+                              lambda lines: batches.append(lines) and False, max_batch=1000)
+    # The first read is checked on its own, then batches double until max_batch
+    assert len(batches[0]) == len(CHUNKS[1])
+    assert len(batches[1]) >= 2 * len(batches[0])
+    assert len(batches[-2]) >= 1000
+    assert ''.join(batches) == ''.join(CHUNKS[1:-1])
+
+
+def test_early_match_is_seen_in_the_first_batch():
+    session = FakeSession(CHUNKS)
+    batches = []
+    assert stream_command(session, 'show user', lambda lines: batches.append(lines) or '10.0.0.0 ' in lines,
+                          max_batch=1000)
+    assert batches == [CHUNKS[1]]
+    assert session.sent[-1] == CTRL_C
+
+
+def test_match_stops_the_output():
+    session = FakeSession(CHUNKS)
+    assert stream_command(session, 'show user', lambda lines: '10.0.0.150 ' in lines, max_batch=1000)
+    assert session.sent[-1] == CTRL_C
+    assert session.chunks
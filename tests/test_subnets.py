@@ -0,0 +1,29 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from aruba_common.subnets import SubnetIndex, line_ips  # noqa: E402
+
+
+def test_line_ips_takes_first_valid_address_per_line():
+    output = ('10.0.0.5    aa:bb:cc:dd:ee:ff  user1  10.9.9.9\n'
+              'no address on this line\n'
+              '300.1.1.1   bogus\n'
+              '192.168.1.255  user2\n')
+    assert line_ips(output).tolist() == [0x0A000005, 0xC0A801FF]
+    assert line_ips('').dtype == np.uint32
+
+
+def test_overlapping_subnets_report_every_label():
+    index = SubnetIndex([('wide', '10.0.0.0/23'), ('narrow', '10.0.1.0/24'), ('other', '172.16.0.0/16')])
+    assert index.matches(line_ips('10.0.1.7\n')) == {'wide', 'narrow'}
+    assert index.matches(line_ips('10.0.0.7\n')) == {'wide'}
+    assert index.contains(line_ips('10.0.2.1\n172.16.3.4\n'), 'other')
+    assert not index.contains(line_ips('10.0.0.7\n'), 'narrow')
+
+
+def test_addresses_outside_every_subnet_match_nothing():
+    index = SubnetIndex([('lab', '10.0.0.1/24')])
+    assert index.segments(line_ips('9.255.255.255\n')).tolist() == [-1]
+    assert index.matches(line_ips('9.255.255.255\n10.0.1.0\n255.255.255.255\n')) == set()
+    assert index.matches(line_ips('10.0.0.255\n')) == {'lab'}
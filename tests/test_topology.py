@@ -0,0 +1,59 @@
+import os
+import sys
+
+import pytest
+
+pytest.importorskip('netaddr')
+# python_example's scripts import each other as top-level modules
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'python_example'))
+
+from topology import preflight  # noqa: E402
+
+
+def router(asn, interfaces, neighbors):
+    return {
+        'bgp': {'asn': asn, 'neighbors': [{'ipaddr': ip, 'remote_asn': remote} for ip, remote in neighbors]},
+        'interfaces': {name: {'ipaddr': ip, 'mask': mask} for name, (ip, mask) in interfaces.items()},
+    }
+
+
+def pair(r1_mask='255.255.255.252', r2_mask='255.255.255.252', r1_remote=65512, r2_remote=65511):
+    return {
+        'r1': router(65511, {'Gi1': ('10.0.12.1', r1_mask)}, [('10.0.12.2', r1_remote)]),
+        'r2': router(65512, {'Gi1': ('10.0.12.2', r2_mask)}, [('10.0.12.1', r2_remote)]),
+    }
+
+
+def test_consistent_inventory_has_no_problems():
+    assert preflight(pair()) == []
+
+
+def test_duplicate_address():
+    inventory = pair()
+    inventory['r3'] = {'interfaces': {'Gi2': {'ipaddr': '10.0.12.1', 'mask': '255.255.255.0'}}}
+    assert any(problem.startswith('10.0.12.1 is configured on r1 Gi1 and r3 Gi2') for problem in preflight(inventory))
+
+
+def test_mask_mismatch():
+    problems = preflight(pair(r2_mask='255.255.255.0'))
+    assert any(problem.startswith('Mask mismatch: ') for problem in problems)
+
+
+def test_wrong_remote_asn_names_the_owner():
+    inventory = pair(r1_remote=65599)
+    inventory['r3'] = router(65599, {}, [])
+    assert preflight(inventory) == [
+        'r1: BGP neighbor 10.0.12.2 remote_asn 65599 belongs to r3, but r2 is AS 65512',
+        'r1: BGP neighbor entry for r2 does not use remote_asn 65512',
+    ]
+
+
+def test_neighbor_not_connected_and_missing_return_entry():
+    inventory = pair()
+    inventory['r1']['bgp']['neighbors'].append({'ipaddr': '192.0.2.1', 'remote_asn': 65513})
+    inventory['r2']['bgp']['neighbors'] = []
+    assert preflight(inventory) == [
+        'r1: r2 has no BGP neighbor entry for r1',
+        'r1: BGP neighbor 192.0.2.1 is not in a connected subnet',
+        'r1: BGP neighbor 192.0.2.1 is not an interface address of any host',
+    ]